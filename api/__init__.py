@@ -8,11 +8,38 @@ from .constants import (
     TargetStrategy as TargetStrategy,
     ChatSource as ChatSource,
     StatusCode as StatusCode,
+    CommandPriority as CommandPriority,
 )
 from .structures import (
     Vector2 as Vector2,
     ApiException as ApiException,
+    UncertainWriteError as UncertainWriteError,
     Tower as Tower,
     Enemy as Enemy,
+    TerrainGrid as TerrainGrid,
+    PackedVector2Array as PackedVector2Array,
 )
 from .game_client import GameClient as GameClient
+from .async_game_client import AsyncGameClient as AsyncGameClient
+from .game_state import GameState as GameState, GameSnapshot as GameSnapshot
+from .batch import CommandBatch as CommandBatch, PendingResult as PendingResult
+from .state_cache import StateCache as StateCache
+from .rate_limit import (
+    RateLimiter as RateLimiter,
+    TokenBucketRateLimiter as TokenBucketRateLimiter,
+)
+from .reconnect import ReconnectPolicy as ReconnectPolicy
+from .policy import (
+    CommandPolicy as CommandPolicy,
+    FAST_RESEND_POLICIES as FAST_RESEND_POLICIES,
+)
+from .recorder import (
+    TrafficLog as TrafficLog,
+    TrafficRecord as TrafficRecord,
+    TrafficRecorder as TrafficRecorder,
+)
+from .metrics import (
+    ClientMetrics as ClientMetrics,
+    LatencyHistogram as LatencyHistogram,
+    MetricsExporter as MetricsExporter,
+)
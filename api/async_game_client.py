@@ -0,0 +1,54 @@
+import asyncio
+from typing import Any, Callable
+
+from .game_client import GameClient
+from .game_client_base import GameClientBase, GameCommand
+
+
+class AsyncGameClient(GameClientBase):
+    """
+    與 `GameClient` 相同的指令，但每個指令都是 coroutine，可以在既有的
+    event loop 中 `await` 或 `asyncio.gather`。
+
+    建立後需要先連線：
+    ```python
+    async with AsyncGameClient(port, token) as agent:
+        money, enemies = await asyncio.gather(
+            agent.get_money(True), agent.get_all_enemies(True)
+        )
+    ```
+    """
+
+    def _start(self) -> None:
+        if self.loop_thread:
+            raise ValueError(
+                "AsyncGameClient runs on the caller's event loop, loop_thread is only for GameClient"
+            )
+        # connecting needs the running event loop, see connect()
+
+    async def connect(self) -> "AsyncGameClient":
+        self._loop = asyncio.get_running_loop()
+        await self._ws_connect()
+        return self
+
+    async def close(self) -> None:  # type: ignore[override]
+        await self._close()
+
+    async def __aenter__(self) -> "AsyncGameClient":
+        return await self.connect()
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+
+def _async_command(command: GameCommand, fn: Callable) -> Callable:
+    wrapped = command.compile_wrapper(fn, is_async=True)
+    wrapped.__qualname__ = f"AsyncGameClient.{fn.__name__}"
+    return wrapped
+
+
+# every command of GameClient, as a coroutine
+for _name, _fn in vars(GameClient).items():
+    _command = getattr(_fn, "game_command", None)
+    if isinstance(_command, GameCommand):
+        setattr(AsyncGameClient, _name, _async_command(_command, _fn.__wrapped__))
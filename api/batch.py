@@ -0,0 +1,131 @@
+import asyncio
+from typing import TYPE_CHECKING, Any, Callable
+
+if TYPE_CHECKING:
+    from .game_client_base import GameClientBase, GameCommand
+
+
+class PendingResult:
+    """
+    批次中一個指令的結果，在批次送出後才會有值。
+
+    `result()` 的行為與直接呼叫指令相同：回傳指令的回傳值（包含被回傳的
+    `ApiException`），或是拋出直接呼叫時會拋出的例外。
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._done = False
+        self._value: Any = None
+        self._exception: BaseException | None = None
+
+    def done(self) -> bool:
+        return self._done
+
+    def result(self) -> Any:
+        if not self._done:
+            raise RuntimeError(
+                f"{self.name} has not been sent yet, leave the batch first"
+            )
+        if self._exception is not None:
+            raise self._exception
+        return self._value
+
+    def _set_result(self, value: Any) -> None:
+        self._value = value
+        self._done = True
+
+    def _set_exception(self, exception: BaseException) -> None:
+        self._exception = exception
+        self._done = True
+
+    def __repr__(self) -> str:
+        if not self._done:
+            return f"PendingResult({self.name}, pending)"
+        if self._exception is not None:
+            return f"PendingResult({self.name}, raised {self._exception!r})"
+        return f"PendingResult({self.name}, {self._value!r})"
+
+
+class CommandBatch:
+    """
+    # Command Batch
+    在區塊中排入多個指令，離開區塊時以最小的間隔連續送出，並等待全部的結果。
+
+    區塊中的每個指令呼叫會立刻回傳一個 `PendingResult`，離開區塊後可以用
+    `result()` 取得結果。一個指令失敗不會影響其他指令。
+
+    ## Example
+    ```python
+    with agent.batch() as b:
+        money = b.get_money(True)
+        cooldown = b.get_spell_cooldown(True, SpellType.POISON)
+        enemies = b.get_all_enemies(True)
+    print(money.result(), cooldown.result(), len(enemies.result()))
+    ```
+    `AsyncGameClient` 則使用 `async with agent.batch() as b:`。
+    """
+
+    def __init__(self, client: "GameClientBase") -> None:
+        self._client = client
+        self._calls: list[
+            tuple["GameCommand", list[Any], dict[str, Any], PendingResult]
+        ] = []
+
+    def __getattr__(self, name: str) -> Callable[..., PendingResult]:
+        command = getattr(getattr(type(self._client), name, None), "game_command", None)
+        if command is None:
+            raise AttributeError(f"{type(self._client).__name__} has no command {name}")
+
+        def queue(*args: Any, **options: Any) -> PendingResult:
+            # missing arguments raise right away, as in a direct call
+            full_args = command.bind(args)
+            pending = PendingResult(name)
+            self._calls.append((command, full_args, options, pending))
+            return pending
+
+        return queue
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def _send_all(self) -> None:
+        calls, self._calls = self._calls, []
+        # the calls are queued on the scheduler together and go out back-to-back,
+        # by priority rather than in the order they were queued
+        await asyncio.gather(*(self._resolve(*call) for call in calls))
+
+    async def _resolve(
+        self,
+        command: "GameCommand",
+        args: list[Any],
+        options: dict[str, Any],
+        pending: PendingResult,
+    ) -> None:
+        try:
+            pending._set_result(
+                await self._client._send_command(
+                    command.command_id,
+                    args,
+                    command.arg_types,
+                    command.inner_ret_type,
+                    **options,
+                )
+            )
+        except Exception as e:
+            pending._set_exception(e)
+
+    def __enter__(self) -> "CommandBatch":
+        return self
+
+    def __exit__(self, exc_type: Any, *exc_info: Any) -> None:
+        # nothing is sent when the block raised
+        if exc_type is None:
+            self._client._run(self._send_all())
+
+    async def __aenter__(self) -> "CommandBatch":
+        return self
+
+    async def __aexit__(self, exc_type: Any, *exc_info: Any) -> None:
+        if exc_type is None:
+            await self._send_all()
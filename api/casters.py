@@ -0,0 +1,189 @@
+import functools
+from enum import IntEnum
+from typing import Any, Callable
+
+from .constants import CommandType, StatusCode
+from .structures import ApiException, Enemy, Tower
+
+Caster = Callable[[Any], Any]
+
+_OK = int(StatusCode.OK)
+
+
+def _unexpected(source_fn: CommandType) -> ApiException:
+    return ApiException(source_fn, StatusCode.INTERNAL_ERR, "unexpected return value")
+
+
+def _failed_cast(source_fn: CommandType, value: Any, ret_type: Any) -> ApiException:
+    return ApiException(
+        source_fn,
+        StatusCode.CLIENT_ERR,
+        f"failed to cast return type from {type(value)} to {ret_type}",
+    )
+
+
+def _compile_cast(source_fn: CommandType, ret_type: Any) -> Caster:
+    """
+    Compiles the cast of a reply value to `ret_type`, once per command.
+    Lists and tuples are always rebuilt, the decoded reply is left as it is.
+    """
+    if ret_type is None:
+
+        def cast_none(value: Any) -> None:
+            if value is not None:
+                raise _unexpected(source_fn)
+            return None
+
+        return cast_none
+
+    origin = getattr(ret_type, "__origin__", None)
+    if origin is list:
+        cast_item = _compile_cast(source_fn, ret_type.__args__[0])
+
+        def cast_list(value: Any) -> list:
+            if not isinstance(value, list):
+                raise _unexpected(source_fn)
+            return [cast_item(item) for item in value]
+
+        return cast_list
+
+    if origin is tuple:
+        size = len(ret_type.__args__)
+        cast_items = [
+            _compile_cast(source_fn, item_type) for item_type in ret_type.__args__
+        ]
+
+        def cast_tuple(value: Any) -> tuple:
+            if not isinstance(value, list) or len(value) != size:
+                raise _unexpected(source_fn)
+            return tuple(cast(item) for cast, item in zip(cast_items, value))
+
+        return cast_tuple
+
+    if isinstance(ret_type, type) and issubclass(ret_type, IntEnum):
+        # members by value; a member is found by itself too
+        members = {int(member): member for member in ret_type}
+
+        def cast_enum(value: Any) -> IntEnum:
+            try:
+                return members[value]
+            except (KeyError, TypeError):
+                raise _failed_cast(source_fn, value, ret_type) from None
+
+        return cast_enum
+
+    if ret_type is Tower or ret_type is Enemy:
+        from_dict = ret_type.from_dict
+
+        def cast_structure(value: Any) -> Any:
+            if type(value) is dict:
+                return from_dict(value)
+            return _cast_scalar(source_fn, ret_type, value)
+
+        return cast_structure
+
+    if ret_type in (str, bool, int):
+        exact = ret_type
+
+        def cast_exact(value: Any) -> Any:
+            if type(value) is exact:
+                return value
+            return _cast_scalar(source_fn, exact, value)
+
+        return cast_exact
+
+    if isinstance(ret_type, type):
+        return functools.partial(_cast_scalar, source_fn, ret_type)
+    raise TypeError(f"{ret_type} is not a supported return type")
+
+
+def _cast_scalar(source_fn: CommandType, ret_type: type, value: Any) -> Any:
+    if isinstance(value, list):
+        raise _unexpected(source_fn)
+    if isinstance(value, ret_type):
+        return value
+    try:
+        return ret_type(value)
+    except Exception:
+        raise _failed_cast(source_fn, value, ret_type) from None
+
+
+def check_response_format(
+    source_fn: CommandType, ret: Any
+) -> tuple[int, StatusCode, Any]:
+    """Splits a reply into its request id, status code and value."""
+    if not isinstance(ret, list):
+        raise ApiException(
+            source_fn,
+            StatusCode.INTERNAL_ERR,
+            "object received from the game was not an array",
+        )
+    if len(ret) < 2:
+        raise ApiException(
+            source_fn,
+            StatusCode.INTERNAL_ERR,
+            "did not receive a request id and a status code",
+        )
+    request_id = ret[0]
+    if not isinstance(request_id, int):
+        raise ApiException(
+            source_fn,
+            StatusCode.INTERNAL_ERR,
+            "the returned request is not an integer",
+        )
+    statuscode = ret[1]
+    if statuscode not in StatusCode:
+        raise ApiException(
+            source_fn,
+            StatusCode.INTERNAL_ERR,
+            f"unknown status code {statuscode} from the server",
+        )
+    statuscode = StatusCode(statuscode)
+    return_value = None
+    match len(ret):
+        case 2:
+            return_value = None
+        case 3:
+            return_value = ret[2]
+        case _:
+            return_value = ret[2:]
+    return (request_id, statuscode, return_value)
+
+
+def check_status_code(
+    source_fn: CommandType, statuscode: StatusCode, value: Any
+) -> None:
+    if statuscode != StatusCode.OK:
+        if isinstance(value, str) and len(value) != 0:
+            raise ApiException(source_fn, statuscode, value)
+        raise ApiException(source_fn, statuscode, "(empty or corrupted error message)")
+
+
+@functools.cache
+def reply_caster(source_fn: CommandType, ret_type: Any) -> Callable[[Any, bool], Any]:
+    """
+    Returns the function that turns a decoded reply of a command declared
+    to return `ret_type` into its return value, or raises its ApiException.
+
+    The function takes the reply and whether its value was already built
+    as `ret_type` by the schema decoder. An OK reply `[request_id, 200,
+    value]` is recognised with a single check and cast by the compiled
+    caster; anything else goes through the full checks of the format and
+    the status code.
+    """
+    cast = _compile_cast(source_fn, ret_type)
+
+    def cast_reply(ret: Any, is_cast: bool) -> Any:
+        if (
+            type(ret) is list
+            and len(ret) == 3
+            and ret[1] == _OK
+            and type(ret[0]) is int
+        ):
+            value = ret[2]
+        else:
+            _, statuscode, value = check_response_format(source_fn, ret)
+            check_status_code(source_fn, statuscode, value)
+        return value if is_cast else cast(value)
+
+    return cast_reply
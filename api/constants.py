@@ -198,3 +198,31 @@ class StatusCode(IntEnum):
 
     CLIENT_ERR = 501
     """Python client 端出現問題（請向開發組反映，對不起！！！）。"""
+
+
+class CommandPriority(IntEnum):
+    """指令送出的優先順序，數字越小越先送出。"""
+
+    ACTION = 0
+    """改變戰局的動作，例如放置防禦塔、派遣單位與施放法術。"""
+
+    READ = 1
+    """查詢遊戲狀態。"""
+
+    COSMETIC = 2
+    """聊天、名稱與其他不影響戰局的指令。"""
+
+
+WRITE_COMMANDS = frozenset(
+    {
+        CommandType.PLACE_TOWER,
+        CommandType.SELL_TOWER,
+        CommandType.SET_STRATEGY,
+        CommandType.SPAWN_UNIT,
+        CommandType.CAST_SPELL,
+        CommandType.SEND_CHAT,
+        CommandType.SET_CHAT_NAME_COLOR,
+        CommandType.SET_NAME,
+    }
+)
+"""會改變遊戲狀態的指令；其他指令都是可以重複送出的查詢。"""
@@ -0,0 +1,76 @@
+import struct
+from collections import OrderedDict
+from typing import Any, Hashable
+
+from .constants import CommandType
+from .serialization import var_to_bytes
+from .structures import Vector2
+
+# A request frame is `[request_id, command_id, *args]`. With the request id
+# encoded as int32, its value always sits right after the array header
+# (type, length) and its own int header.
+_REQUEST_ID_OFFSET = 12
+_REQUEST_ID = struct.Struct("<i")
+
+
+def _template_key(command_id: CommandType, args: list[Any]) -> Hashable | None:
+    """
+    A key that is equal exactly when two commands encode to the same frame,
+    or None when an argument cannot be keyed by value.
+    """
+    key: list[Hashable] = [int(command_id)]
+    for arg in args:
+        if isinstance(arg, Vector2):
+            # Vector2 hashes by identity and is mutable, key it by its coordinates
+            key.append((Vector2, arg.x, arg.y))
+        elif isinstance(arg, (bool, int, str)):
+            # the type keeps True and 1 apart, they encode differently
+            key.append((type(arg), arg))
+        else:
+            return None
+    return tuple(key)
+
+
+class FrameTemplateCache:
+    """
+    Pre-encoded request frames keyed by command and arguments.
+
+    Repeated commands such as `get_money(True)` only differ in the request
+    id, which is patched into a copy of the cached frame. Frames larger than
+    `max_frame_size` (e.g. chat messages) are never cached, the others are
+    evicted least recently used beyond `capacity`.
+    """
+
+    def __init__(self, capacity: int = 256, max_frame_size: int = 128) -> None:
+        self.capacity = capacity
+        self.max_frame_size = max_frame_size
+        self.hits = 0
+        self.misses = 0
+        self._templates: OrderedDict[Hashable, bytearray] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+    def encode(
+        self, request_id: int, command_id: CommandType, args: list[Any]
+    ) -> bytes:
+        if not -(2**31) <= request_id < 2**31:
+            return var_to_bytes([request_id, int(command_id), *args])
+        key = _template_key(command_id, args)
+        template = self._templates.get(key) if key is not None else None
+        if template is not None:
+            self.hits += 1
+            self._templates.move_to_end(key)
+        else:
+            self.misses += 1
+            template = bytearray(var_to_bytes([0, int(command_id), *args]))
+            if key is not None and len(template) <= self.max_frame_size:
+                self._templates[key] = template
+                if len(self._templates) > self.capacity:
+                    self._templates.popitem(last=False)
+        _REQUEST_ID.pack_into(template, _REQUEST_ID_OFFSET, request_id)
+        # a copy, the template is patched again by the next command
+        return bytes(template)
+
+    def clear(self) -> None:
+        self._templates.clear()
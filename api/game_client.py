@@ -12,6 +12,7 @@ from .structures import (
     Vector2,
     Tower,
     Enemy,
+    TerrainGrid,
 )
 from .game_client_base import GameClientBase, game_command
 
@@ -63,6 +64,34 @@ class GameClient(GameClientBase):
         """
         raise NotImplementedError
 
+    @game_command(CommandType.GET_ALL_TERRAIN, [], TerrainGrid)
+    def get_terrain_grid(self) -> TerrainGrid:
+        """
+        # Get Terrain Grid
+        取得地圖上所有地形的資訊，與 `get_all_terrain` 相同，但以緊湊的 `TerrainGrid` 回傳。
+
+        ## Parameters
+        無參數
+
+        ## Returns
+        這個函數返回一個 `TerrainGrid`，每格只佔一個 byte，直接由伺服器回傳的資料解碼，
+        適合大地圖或需要頻繁掃描地形的情境。`grid[x, y]` 等同於 `get_all_terrain()[x][y]`，
+        超出範圍時回傳 `TerrainType.OUT_OF_BOUNDS`。
+
+        ## Example
+        ```python
+        grid = agent.get_terrain_grid()
+        rows, cols = grid.shape
+        empty = [
+            Vector2(x, y)
+            for x in range(rows)
+            for y in range(cols)
+            if grid[x, y] == TerrainType.EMPTY
+        ]
+        ```
+        """
+        raise NotImplementedError
+
     @game_command(CommandType.GET_TERRAIN, [Vector2], TerrainType)
     def get_terrain(self, pos: Vector2) -> TerrainType:
         """
@@ -1,15 +1,39 @@
 import asyncio
+import copy
+import functools
 import re
+import threading
 import time
 import inspect
-from typing import Any, Callable, cast
+from typing import Any, Callable, Coroutine, Hashable, TypeVar, cast
 
-from .constants import CommandType, StatusCode
-from .structures import ApiException, Tower, Enemy
-from .serialization import var_to_bytes, bytes_to_var
+from .constants import CommandPriority, CommandType, StatusCode, WRITE_COMMANDS
+from .structures import ApiException, UncertainWriteError
+from .serialization import bytes_to_var, peek_request_id, schema_reply_decoder
+from .frame_templates import FrameTemplateCache, _template_key
+from .batch import CommandBatch
+from .rate_limit import RateLimiter, TokenBucketRateLimiter
+from .scheduler import CommandScheduler, default_priority
+from .state_cache import StateCache
+from .reconnect import ReconnectPolicy
+from .metrics import ClientMetrics, MetricsExporter
+from .policy import CommandPolicy
+from .casters import reply_caster
+from .recorder import RECEIVED, SENT, TrafficRecorder
 from .utils import is_auto_invoked, enforce_type, enforce_condition
 from .logger import logger
-from websockets.asyncio.client import connect
+from websockets.asyncio.client import ClientConnection, connect
+from websockets.exceptions import ConnectionClosed
+
+T = TypeVar("T")
+ReplyDecoder = Callable[[bytes], tuple[list, bool]]
+
+
+_DEFAULT_POLICY = CommandPolicy()
+
+
+class _ReplayRequest(Exception):
+    """Set on the reply of a read in flight when the connection drops."""
 
 
 class GameClientBase:
@@ -22,6 +46,17 @@ class GameClientBase:
         server_domain: str = "localhost",
         command_timeout_msec: int = 1000,
         retry_count: int = 3,
+        lazy_lists: bool = False,
+        rate_limiter: RateLimiter | None = None,
+        cache: StateCache | None = None,
+        coalesce_reads: bool = True,
+        loop_thread: bool = False,
+        auto_reconnect: bool = True,
+        reconnect_policy: ReconnectPolicy | None = None,
+        metrics: bool = True,
+        policies: dict[CommandType, CommandPolicy] | None = None,
+        trusted: bool = False,
+        recorder: TrafficRecorder | None = None,
     ) -> None:
         if token is None:
             if is_auto_invoked():
@@ -48,24 +83,154 @@ class GameClientBase:
         )
         enforce_type("retry_count", retry_count, int)
         enforce_condition("retry_count must be positive", retry_count, lambda x: x > 0)
+        enforce_type("lazy_lists", lazy_lists, bool)
+        if rate_limiter is None:
+            rate_limiter = TokenBucketRateLimiter(
+                rate=1000 / self.COMMAND_RATE_LIMIT_MSEC
+            )
+        enforce_type("rate_limiter", rate_limiter, RateLimiter)
+        enforce_type("cache", cache, StateCache, type(None))
+        enforce_type("coalesce_reads", coalesce_reads, bool)
+        enforce_type("loop_thread", loop_thread, bool)
+        enforce_type("auto_reconnect", auto_reconnect, bool)
+        if reconnect_policy is None:
+            reconnect_policy = ReconnectPolicy()
+        enforce_type("reconnect_policy", reconnect_policy, ReconnectPolicy)
+        enforce_type("metrics", metrics, bool)
+        enforce_type("trusted", trusted, bool)
+        enforce_type("recorder", recorder, TrafficRecorder, type(None))
+        policies = policies or {}
+        for command_id, policy in policies.items():
+            enforce_type(f"policy of {command_id.name}", policy, CommandPolicy)
+            policy.check(command_id)
 
         self.port = port
         self.token = token.lower()
         self.server_domain = server_domain
         self.command_timeout_msec = command_timeout_msec
         self.retry_count = retry_count
+        # trusted clients skip the checks of the argument types, for bots
+        # that are known to call the commands correctly
+        self.trusted = trusted
+        # timeout, retries, resends and hedging of each command; the commands
+        # without a policy use the client's timeout and retry count
+        self.policies = {
+            command_id: policies.get(command_id, _DEFAULT_POLICY)
+            for command_id in CommandType
+        }
+        # list replies with a schema (towers, enemies, paths) are returned as
+        # LazyList views that decode each element on first access
+        self.lazy_lists = lazy_lists
+        # paces the sends and learns the server's limit from TOO_FREQUENT replies
+        self.rate_limiter = rate_limiter
+        # opt-in cache of read replies, dropped by the writes that change them
+        self.cache = cache
+        # identical reads in flight at the same time share one request;
+        # writes are never shared
+        self.coalesce_reads = coalesce_reads
+        self.coalesced_reads = 0
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        # with a loop thread, the client runs its event loop on its own I/O
+        # thread and can be called from any number of threads
+        self.loop_thread = loop_thread
+        self._loop_thread: threading.Thread | None = None
+        # a dropped connection is reopened with the same token; reads in flight
+        # are sent again, writes in flight fail with UncertainWriteError
+        self.auto_reconnect = auto_reconnect
+        self.reconnect_policy = reconnect_policy
+        self.connection_stats: dict[str, float] = {
+            "reconnects": 0,
+            "failed_attempts": 0,
+            "replayed_reads": 0,
+            "uncertain_writes": 0,
+            "last_reconnect_latency": 0.0,
+            "max_reconnect_latency": 0.0,
+            "total_downtime": 0.0,
+        }
+        self._connected = asyncio.Event()
+        self._connection_error: Exception | None = None
+        self._reconnect_task: asyncio.Task | None = None
+        self._closing = False
+        # opt-in log of every command frame sent and received, closed with the client
+        self.recorder = recorder
+        # latency by phase and counters per command, see metrics()
+        self._metrics = ClientMetrics() if metrics else None
 
         self.sent_command_count = 0
-        self.last_command = time.time_ns()
+        self.frame_templates = FrameTemplateCache()
         self.server_url = f"ws://{self.server_domain}:{self.port}"
-        asyncio.get_event_loop().run_until_complete(self.__ws_connect())
+        # requests waiting for a reply by request id, oldest first; each holds
+        # the future of its reply, the decoder of its return type, its command
+        # and when it was sent (time.perf_counter())
+        self._pending: dict[
+            int, tuple[asyncio.Future, ReplyDecoder | None, CommandType, float]
+        ] = {}
+        # how many commands wait for each request, more than one when merged
+        # by the scheduler; the last one to leave forgets the request
+        self._request_holders: dict[int, int] = {}
+        # several commands can be in flight; their sends go out one at a time,
+        # by priority, each after the rate limiter allows it
+        self.scheduler = CommandScheduler(
+            lambda: self.rate_limiter.acquire(),
+            self.__send_request,
+            self.__record_wait if self._metrics is not None else None,
+            merge_reads=coalesce_reads,
+        )
+        self._start()
+
+    def _start(self) -> None:
+        """Connects right away; `AsyncGameClient` defers this to `connect()`."""
+        if self.loop_thread:
+            self._loop = asyncio.new_event_loop()
+            self._loop_thread = threading.Thread(
+                target=self._loop.run_forever, name="GameClient I/O", daemon=True
+            )
+            self._loop_thread.start()
+        else:
+            self._loop = asyncio.get_event_loop()
+        self._run(self._ws_connect())
 
-    async def __ws_connect(self) -> None:
+    def _run(self, coro: Coroutine[Any, Any, T]) -> T:
+        """Runs a coroutine of this client to completion from synchronous code."""
+        if self._loop_thread is None:
+            return self._loop.run_until_complete(coro)
+        if threading.current_thread() is self._loop_thread:
+            coro.close()
+            raise RuntimeError(
+                "blocking commands cannot be called on the I/O thread of the client, e.g. from a GameState callback"
+            )
+        # the command runs on the I/O thread, this thread only waits for it
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def close(self) -> None:
+        """Disconnects and stops the background tasks (and the loop thread) of the client."""
+        self._run(self._close())
+        if self._loop_thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop_thread.join()
+            self._loop_thread = None
+
+    async def _close(self) -> None:
+        self._closing = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+        self.scheduler.close()
+        await self.ws.close()
+        await self._recv_task
+        if self.recorder is not None:
+            self.recorder.close()
+
+    async def _ws_connect(self) -> None:
         self.ws = await connect(self.server_url)
         authed = await self.__ws_authenticate()
         if not authed:
             raise ConnectionError("authentication failed. Is the token correct?")
         logger.info(f"connected to {self.server_url}")
+        self._recv_task = asyncio.get_running_loop().create_task(
+            self.__recv_replies(self.ws)
+        )
+        self._connection_error = None
+        self._connected.set()
         # no need to disconnect by ws.close(); the socket is automatically disconnected on program exit
 
     async def __ws_authenticate(self) -> bool:
@@ -78,24 +243,251 @@ class GameClientBase:
         logger.info(f"Server says: {response}")
         return response == "Connection OK. Have Fun!"  # magic string from game server
 
-    async def __ws_send_gdvars(self, deserialized: Any) -> None:
-        serialized = var_to_bytes(deserialized)
-        await self.ws.send(serialized)
+    async def __ws_send_command(
+        self,
+        ws: ClientConnection,
+        request_id: int,
+        command_id: CommandType,
+        args: list[Any],
+    ) -> None:
+        serialized = self.frame_templates.encode(request_id, command_id, args)
+        await ws.send(serialized)
+        if self.recorder is not None:
+            self.recorder.record(SENT, request_id, command_id, serialized)
+        if self._metrics is not None:
+            self._metrics.count(command_id, "bytes_out", len(serialized))
 
-    async def __ws_recv_gdvars(self) -> Any:
-        recved = await self.ws.recv()
-        enforce_type("serialized byte sequence received", recved, bytes)
-        serialized: bytes = cast(bytes, recved)
-        deserialized = bytes_to_var(serialized)
-        return deserialized
+    async def __recv_replies(self, ws: ClientConnection) -> None:
+        """Routes every reply to the request it answers, until the connection closes."""
+        error = ConnectionError("the connection to the game server was closed")
+        try:
+            async for message in ws:
+                self.__route_reply(message)
+        except Exception as e:
+            error = ConnectionError(f"the connection to the game server was lost: {e}")
+        if ws is self.ws:
+            self.__connection_lost(error)
 
-    def __wait_for_next_command(self) -> Any:
-        time_to_wait = self.COMMAND_RATE_LIMIT_MSEC * 1_000_000 - (
-            time.time_ns() - self.last_command
+    def __connection_lost(self, error: Exception) -> None:
+        """Fails or replays the requests in flight, and reconnects if enabled."""
+        if self._reconnect_task is not None and not self._reconnect_task.done():
+            return
+        self._connected.clear()
+        reconnecting = self.auto_reconnect and not self._closing
+        for future, _, command_id, _ in self._pending.values():
+            if future.done():
+                continue
+            if not reconnecting:
+                future.set_exception(error)
+            elif command_id in WRITE_COMMANDS:
+                self.connection_stats["uncertain_writes"] += 1
+                future.set_exception(
+                    UncertainWriteError(
+                        command_id,
+                        StatusCode.CLIENT_ERR,
+                        f"the connection was lost after {command_id.name} was sent, it may or may not have been applied",
+                    )
+                )
+            else:
+                self.connection_stats["replayed_reads"] += 1
+                future.set_exception(_ReplayRequest())
+        self._pending.clear()
+        if not reconnecting:
+            self._connection_error = error
+            # wakes up the sends waiting for the connection, they fail with the error
+            self._connected.set()
+            return
+        logger.warning(f"{error}, reconnecting")
+        self._reconnect_task = self._loop.create_task(self.__reconnect())
+
+    async def __reconnect(self) -> None:
+        lost_at = time.monotonic()
+        policy = self.reconnect_policy
+        attempt = 0
+        while policy.max_attempts is None or attempt < policy.max_attempts:
+            await asyncio.sleep(policy.delay(attempt))
+            attempt += 1
+            try:
+                await self._ws_connect()
+            except Exception as e:
+                self.connection_stats["failed_attempts"] += 1
+                logger.warning(f"reconnect attempt {attempt} failed: {e}")
+                continue
+            latency = time.monotonic() - lost_at
+            stats = self.connection_stats
+            stats["reconnects"] += 1
+            stats["last_reconnect_latency"] = latency
+            stats["max_reconnect_latency"] = max(
+                stats["max_reconnect_latency"], latency
+            )
+            stats["total_downtime"] += latency
+            logger.info(f"reconnected after {latency:.3f} s")
+            return
+        self.connection_stats["total_downtime"] += time.monotonic() - lost_at
+        self._connection_error = ConnectionError(
+            f"could not reconnect to {self.server_url} after {attempt} attempts"
         )
-        if time_to_wait >= 0:
-            fut = asyncio.sleep(time_to_wait / (10**9))
-            asyncio.get_event_loop().run_until_complete(fut)
+        logger.error(str(self._connection_error))
+        self._connected.set()
+
+    def __route_reply(self, message: str | bytes) -> None:
+        request_id = peek_request_id(message) if isinstance(message, bytes) else None
+        pending = self._pending.pop(request_id, None) if request_id else None
+        if pending is None:
+            if request_id or not self._pending:
+                if self.recorder is not None:
+                    self.recorder.record(RECEIVED, request_id, None, message)
+                logger.debug(f"dropped a reply to request {request_id}")
+                return
+            # replies without a request id are taken by the oldest request
+            pending = self._pending.pop(next(iter(self._pending)))
+        future, decode_reply, command_id, sent_at = pending
+        if self.recorder is not None:
+            self.recorder.record(RECEIVED, request_id, command_id, message)
+        if future.done():
+            return
+        metrics = self._metrics
+        if metrics is not None:
+            received_at = time.perf_counter()
+            metrics.record(command_id, "round_trip", received_at - sent_at)
+            metrics.count(command_id, "bytes_in", len(message))
+        try:
+            future.set_result(self.__decode_reply(message, decode_reply))
+        except Exception as e:
+            future.set_exception(e)
+        if metrics is not None:
+            metrics.record(command_id, "decode", time.perf_counter() - received_at)
+
+    def __decode_reply(
+        self, message: str | bytes, decode_reply: ReplyDecoder | None
+    ) -> tuple[Any, bool]:
+        """Returns the decoded reply and whether its value is already of the declared return type."""
+        if not isinstance(message, bytes):
+            enforce_type("serialized byte sequence received", message, bytes)
+        serialized: bytes = cast(bytes, message)
+        if decode_reply is not None:
+            return decode_reply(serialized)
+        return bytes_to_var(serialized), False
+
+    async def __send_request(
+        self,
+        command_id: CommandType,
+        args: list[Any],
+        decode_reply: ReplyDecoder | None,
+        deadline: float | None,
+    ) -> tuple[int, asyncio.Future]:
+        """Sends a request with a new id, returns the id and the future of its reply."""
+        while True:
+            # while reconnecting, sends wait for the new connection
+            await self.__wait_connected(command_id, deadline)
+            if self._connection_error is not None:
+                raise self._connection_error
+            ws = self.ws
+            self.sent_command_count += 1
+            request_id = self.sent_command_count
+            future = self._loop.create_future()
+            self._pending[request_id] = (
+                future,
+                decode_reply,
+                command_id,
+                time.perf_counter(),
+            )
+            try:
+                await self.__ws_send_command(ws, request_id, command_id, args)
+            except ConnectionClosed as e:
+                # the request never left, send it again on the next connection
+                self.__drop_request(request_id, future)
+                if ws is self.ws:
+                    self.__connection_lost(
+                        ConnectionError(
+                            f"the connection to the game server was lost: {e}"
+                        )
+                    )
+                continue
+            except BaseException:
+                self.__drop_request(request_id, future)
+                raise
+            if self._metrics is not None:
+                self._metrics.count(command_id, "sent")
+            return request_id, future
+
+    def __drop_request(self, request_id: int, future: asyncio.Future) -> None:
+        """Forgets a request that was not sent, and the future of its reply."""
+        self._pending.pop(request_id, None)
+        if not future.done():
+            future.cancel()
+        elif not future.cancelled():
+            # failed by __connection_lost, but nobody waits for it
+            future.exception()
+
+    async def __wait_connected(
+        self, command_id: CommandType, deadline: float | None
+    ) -> None:
+        """Waits for the connection, at most the timeout of the command and until its deadline."""
+        if (
+            self._connection_error is not None
+            and self.auto_reconnect
+            and not self._closing
+            and (self._reconnect_task is None or self._reconnect_task.done())
+        ):
+            # the last round of attempts gave up, this command starts another
+            self._connection_error = None
+            self._connected.clear()
+            self._reconnect_task = self._loop.create_task(self.__reconnect())
+        if self._connected.is_set():
+            return
+        timeout = self.policies[command_id].timeout or self.command_timeout_msec / 1000
+        if deadline is not None:
+            timeout = min(timeout, deadline - time.monotonic())
+        try:
+            await asyncio.wait_for(self._connected.wait(), max(0.0, timeout))
+        except asyncio.TimeoutError:
+            raise ApiException(
+                command_id,
+                StatusCode.CLIENT_ERR,
+                f"{command_id.name} was not sent, the connection to the game server is down",
+            ) from None
+
+    def __record_wait(self, command_id: CommandType, seconds: float) -> None:
+        assert self._metrics is not None
+        self._metrics.record(command_id, "rate_limit_wait", seconds)
+
+    def metrics(self) -> dict[str, dict[str, Any]]:
+        """
+        # Metrics
+        每種指令的延遲分布與計數，以指令名稱為鍵。
+
+        延遲（秒）分為幾個階段：`rate_limit_wait`（等待發送頻率限制）、
+        `round_trip`（送出到收到回覆）、`decode`（解碼回覆）、`cast`（檢查
+        回覆並轉換回傳值型別）與 `total`（整個呼叫，包含重送）；每個階段有 `count`、
+        `mean`、`min`、`max` 與 `p50`、`p90`、`p99`、`p99.9`。計數有
+        `calls`、`sent`、`retries`、`hedges`、`timeouts`、`too_frequent`、
+        `not_started_waits`、`replays`、`errors`、`bytes_out` 與 `bytes_in`。
+
+        建立 client 時傳入 `metrics=False` 可關閉統計，此時回傳空的字典。
+
+        ## Example
+        ```python
+        agent.get_money(True)
+        stats = agent.metrics()["GET_MONEY"]
+        print(stats["round_trip"]["p99"], stats["too_frequent"])
+        ```
+        """
+        if self._metrics is None:
+            return {}
+        return self._metrics.snapshot()
+
+    def export_metrics(
+        self, path: str | None = None, port: int | None = None, interval: float = 5.0
+    ) -> MetricsExporter:
+        """
+        # Export Metrics
+        在背景定期把統計以文字格式（Prometheus 格式）寫入檔案 `path`，
+        或是在本機的 `port` 提供 HTTP 查詢。用回傳值的 `stop()` 停止。
+        """
+        if self._metrics is None:
+            raise RuntimeError("metrics are disabled on this client")
+        return MetricsExporter(self._metrics, path, port, interval)
 
     def __check_arg_types(
         self, source_fn: CommandType, arg_types: list[type], args: list[Any]
@@ -116,209 +508,443 @@ class GameClientBase:
                     )
         return True
 
-    def __check_response_format(
-        self, source_fn: CommandType, ret: Any
-    ) -> tuple[int, StatusCode, Any]:
-        if not isinstance(ret, list):
-            raise ApiException(
-                source_fn,
-                StatusCode.INTERNAL_ERR,
-                "object received from the game was not an array",
-            )
-        if len(ret) < 2:
-            raise ApiException(
-                source_fn,
-                StatusCode.INTERNAL_ERR,
-                "did not receive a request id and a status code",
-            )
-        request_id = ret[0]
-        if not isinstance(request_id, int):
-            raise ApiException(
-                source_fn,
-                StatusCode.INTERNAL_ERR,
-                "the returned request is not an integer",
+    def batch(self) -> CommandBatch:
+        """Queues the commands called in a `with` block and sends them together, see `CommandBatch`."""
+        return CommandBatch(self)
+
+    def await_send_command(
+        self,
+        command_id: CommandType,
+        args: list[Any],
+        arg_types: list[type],
+        inner_ret_type: type | None,
+        priority: CommandPriority | None = None,
+        deadline: float | None = None,
+        bypass_cache: bool = False,
+        checked: bool = False,
+    ) -> Any:
+        return self._run(
+            self._send_command(
+                command_id,
+                args,
+                arg_types,
+                inner_ret_type,
+                priority,
+                deadline,
+                bypass_cache,
+                checked,
             )
-        statuscode = ret[1]
-        if statuscode not in StatusCode:
-            raise ApiException(
-                source_fn,
-                StatusCode.INTERNAL_ERR,
-                f"unknown status code {statuscode} from the server",
+        )
+
+    async def _send_command(
+        self,
+        command_id: CommandType,
+        args: list[Any],
+        arg_types: list[type],
+        inner_ret_type: type | None,
+        priority: CommandPriority | None = None,
+        deadline: float | None = None,
+        bypass_cache: bool = False,
+        checked: bool = False,
+    ) -> Any:
+        """
+        The command loop shared by the sync and async clients.
+
+        `priority` defaults to the class of the command, see `default_priority`.
+        `deadline` is the number of seconds the command may wait to be sent.
+        With `bypass_cache`, a cached reply is ignored and replaced.
+        `checked` tells that the types of `args` were already checked, as
+        the methods generated by `game_command` do.
+        """
+        if not (checked or self.trusted):
+            try:
+                self.__check_arg_types(command_id, arg_types, args)
+            except ApiException as e:
+                return e
+        cache = self.cache
+        if cache is None:
+            return await self.__run_shared(
+                command_id, args, arg_types, inner_ret_type, priority, deadline
             )
-        statuscode = StatusCode(statuscode)
-        return_value = None
-        match len(ret):
-            case 2:
-                return_value = None
-            case 3:
-                return_value = ret[2]
-            case _:
-                return_value = ret[2:]
-        return (request_id, statuscode, return_value)
-
-    def __check_status_code(
-        self, source_fn: CommandType, statuscode: StatusCode, value: Any
-    ) -> None:
-        if statuscode != StatusCode.OK:
-            if isinstance(value, str) and len(value) != 0:
-                raise ApiException(source_fn, statuscode, value)
-            raise ApiException(
-                source_fn, statuscode, "(empty or corrupted error message)"
+        key = cache.key(command_id, args, inner_ret_type)
+        if key is not None and not bypass_cache:
+            hit, value = cache.lookup(key)
+            if hit:
+                return value
+        generation = cache.generation
+        try:
+            value = await self.__run_shared(
+                command_id, args, arg_types, inner_ret_type, priority, deadline
             )
+        except BaseException:
+            # a write may have been applied before it failed
+            cache.observe(command_id, None)
+            raise
+        if key is not None and not isinstance(value, ApiException):
+            cache.store(command_id, key, generation, value)
+        cache.observe(command_id, value)
+        return value
 
-    def __cast_return_type(
-        self, source_fn: CommandType, inner_ret_type: type | None, ret: Any
+    async def __run_shared(
+        self,
+        command_id: CommandType,
+        args: list[Any],
+        arg_types: list[type],
+        inner_ret_type: type | None,
+        priority: CommandPriority | None,
+        deadline: float | None,
     ) -> Any:
-        if inner_ret_type is None:
-            if ret is None:
-                return ret
-            else:
-                raise ApiException(
-                    source_fn, StatusCode.INTERNAL_ERR, "unexpected return value"
-                )
-
-        if isinstance(ret, list):
-            if inner_ret_type.__origin__ is list:
-                for i in range(len(ret)):
-                    ret[i] = self.__cast_return_type(
-                        source_fn, inner_ret_type.__args__[0], ret[i]
-                    )
-                return ret
-            elif inner_ret_type.__origin__ is tuple:
-                if len(ret) != len(inner_ret_type.__args__):
-                    raise ApiException(
-                        source_fn, StatusCode.INTERNAL_ERR, "unexpected return value"
-                    )
-                for i in range(len(ret)):
-                    ret[i] = self.__cast_return_type(
-                        source_fn, inner_ret_type.__args__[i], ret[i]
-                    )
-                return tuple(ret)
-            else:
-                raise ApiException(
-                    source_fn, StatusCode.INTERNAL_ERR, "unexpected return value"
-                )
-        elif isinstance(ret, inner_ret_type):
-            return ret
-        elif isinstance(ret, dict) and inner_ret_type in (Tower, Enemy):
-            if inner_ret_type == Tower:
-                return Tower.from_dict(ret)
-            elif inner_ret_type == Enemy:
-                return Enemy.from_dict(ret)
-            elif inner_ret_type is dict:
-                return ret
-            else:
-                raise ApiException(
-                    source_fn,
-                    StatusCode.INTERNAL_ERR,
-                    f"unexpected return value of type {type(ret)} for {inner_ret_type}",
+        """Runs the command, sharing the run of an identical read already in flight."""
+        key = None
+        if self.coalesce_reads and command_id not in WRITE_COMMANDS:
+            key = _template_key(command_id, args)
+        if key is None:
+            return await self.__run_command(
+                command_id, args, arg_types, inner_ret_type, priority, deadline
+            )
+        key = (key, inner_ret_type)
+        shared = self._inflight.get(key)
+        if shared is None:
+            shared = self._loop.create_task(
+                self.__run_command(
+                    command_id, args, arg_types, inner_ret_type, priority, deadline
                 )
-        try:
-            return inner_ret_type(ret)
-        except Exception:
-            raise ApiException(
-                source_fn,
-                StatusCode.CLIENT_ERR,
-                f"failed to cast return type from {type(ret)} to {inner_ret_type}",
             )
+            self._inflight[key] = shared
+            shared.add_done_callback(functools.partial(self.__forget_inflight, key))
+            # a cancelled caller leaves the run to the others
+            return await asyncio.shield(shared)
+        self.coalesced_reads += 1
+        value = await asyncio.shield(shared)
+        # the value belongs to the caller that started the run, the others
+        # get their own copy so that changing one result leaves the rest alone
+        if isinstance(value, ApiException):
+            return value
+        return copy.deepcopy(value)
 
-    def await_send_command(
+    def __forget_inflight(self, key: Hashable, shared: asyncio.Task) -> None:
+        if self._inflight.get(key) is shared:
+            del self._inflight[key]
+        # all of its callers may have been cancelled, nobody else reads the error
+        if not shared.cancelled():
+            shared.exception()
+
+    async def __run_command(
         self,
         command_id: CommandType,
         args: list[Any],
         arg_types: list[type],
         inner_ret_type: type | None,
+        priority: CommandPriority | None,
+        deadline: float | None,
     ) -> Any:
-        should_resend = True
-        request_id = 0
-        retry_count = self.retry_count
-        while retry_count > 0:
-            # send request with a new id
-            if should_resend:
-                self.sent_command_count += 1
-                request_id = self.sent_command_count
+        if priority is None:
+            priority = default_priority(command_id)
+        if deadline is not None:
+            deadline += time.monotonic()
+        policy = self.policies[command_id]
+        timeout = policy.timeout or self.command_timeout_msec / 1000
+        max_retries = policy.max_retries or self.retry_count
+        retry_count = max_retries
+        # replies of types with a schema are decoded straight into their final
+        # objects, the others are cast by a caster compiled for the return type
+        decode_reply = schema_reply_decoder(inner_ret_type, self.lazy_lists)
+        cast_reply = reply_caster(command_id, inner_ret_type)
+        metrics = self._metrics
+        if metrics is not None:
+            started = time.perf_counter()
+            counters = metrics.command(command_id).counters
+            counters["calls"] += 1
+        # the requests of this command still waiting for a reply, with their ids;
+        # after a resend or a hedge, the first reply of any of them is taken
+        replies: dict[asyncio.Future, int] = {}
+        # the replies to requests of this command's own, not merged into
+        # another's; only those tell the rate limiter how the server took them
+        owned: set[asyncio.Future] = set()
+        held: list[int] = []
+        send = True
+        hedge = False
+        sends = 0
+        try:
+            while retry_count > 0:
+                # send request with a new id
+                if send or hedge:
+                    if metrics is not None:
+                        if hedge:
+                            counters["hedges"] += 1
+                        elif sends:
+                            counters["retries"] += 1
+                    sends += 1
+                    try:
+                        # while reconnecting, each command waits on its own
+                        # rather than holding up the queue
+                        await self.__wait_connected(command_id, deadline)
+                        request_id, reply, owner = await self.scheduler.submit(
+                            command_id, list(args), decode_reply, priority, deadline
+                        )
+                    except ApiException as e:
+                        if metrics is not None:
+                            counters["errors"] += 1
+                        return e
+                    except Exception as e:
+                        raise ApiException(
+                            command_id,
+                            StatusCode.CLIENT_ERR,
+                            f"unexpected error\nwhat: {e}",
+                        )
+                    replies[reply] = request_id
+                    held.append(request_id)
+                    holders = self._request_holders
+                    holders[request_id] = holders.get(request_id, 0) + 1
+                    if owner:
+                        owned.add(reply)
+                    if send:
+                        attempt_started = time.monotonic()
+                        hedged = False
+                    send = hedge = False
+                # wait for the first reply to any request of this command
+                # - a read still without a reply after `hedge_after` is sent once more
+                # - if it times out, keep waiting (and resend, if the policy says so) until the retry limit is reached
+                # - if it is rejected by the server with TOO_FREQUENT, resend the same request with a different id
+                # - if it failed with a known API exception, return the error
+                # - if it fails for any other reason, raise the exception
+                waited = time.monotonic() - attempt_started
+                wait = timeout - waited
+                hedge_wait = None
+                if policy.hedge_after is not None and not hedged:
+                    hedge_wait = policy.hedge_after - waited
+                done, _ = await asyncio.wait(
+                    replies,
+                    timeout=max(
+                        0.0, wait if hedge_wait is None else min(wait, hedge_wait)
+                    ),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    if hedge_wait is not None and hedge_wait < wait:
+                        hedge = hedged = True
+                        continue
+                    retry_count -= 1
+                    if metrics is not None:
+                        counters["timeouts"] += 1
+                    logger.warning(f"command {command_id.name} timed out, retrying")
+                    if policy.resend_on_timeout and retry_count > 0:
+                        await asyncio.sleep(
+                            policy.backoff_delay(max_retries - retry_count)
+                        )
+                        send = True
+                    else:
+                        attempt_started = time.monotonic()
+                    continue
+                reply = done.pop()
+                del replies[reply]
                 try:
-                    self.__check_arg_types(command_id, arg_types, list(args))
-                    self.__wait_for_next_command()
-                    wrapped_args = [request_id, int(command_id), *args]
-                    asyncio.get_event_loop().run_until_complete(
-                        self.__ws_send_gdvars(wrapped_args)
-                    )
-                    self.last_command = time.time_ns()
+                    ret, is_cast = reply.result()
+                    try:
+                        if metrics is None:
+                            value = cast_reply(ret, is_cast)
+                        else:
+                            cast_started = time.perf_counter()
+                            value = cast_reply(ret, is_cast)
+                            metrics.record(
+                                command_id, "cast", time.perf_counter() - cast_started
+                            )
+                    except ApiException as e:
+                        if reply in owned:
+                            if e.code == StatusCode.TOO_FREQUENT:
+                                self.rate_limiter.on_rejected()
+                            else:
+                                self.rate_limiter.on_accepted()
+                        raise
+                    if reply in owned:
+                        self.rate_limiter.on_accepted()
+                        return value
+                    # merged into another command's request, which gets the
+                    # reply itself; as in __run_shared, this one gets a copy
+                    return copy.deepcopy(value)
+                except _ReplayRequest:
+                    # the connection dropped before the reply, send the read again
+                    send = not replies
+                    if metrics is not None:
+                        counters["replays"] += 1
                 except ApiException as e:
-                    return e
+                    if e.code == StatusCode.TOO_FREQUENT:
+                        send = not replies
+                        if metrics is not None:
+                            counters["too_frequent"] += 1
+                    elif (
+                        e.code == StatusCode.NOT_STARTED or e.code == StatusCode.PAUSED
+                    ):
+                        if metrics is not None:
+                            counters["not_started_waits"] += 1
+                        if not replies:
+                            # poll the game every 0.1 second until it starts again
+                            await asyncio.sleep(0.1)
+                            send = True
+                    else:
+                        if metrics is not None:
+                            counters["errors"] += 1
+                        return e
                 except Exception as e:
                     raise ApiException(
                         command_id,
                         StatusCode.CLIENT_ERR,
                         f"unexpected error\nwhat: {e}",
                     )
-                should_resend = False
-            # wait for a response
-            # - if it times out, retry receiving response until the limit is reached
-            # - if it is rejected by the server with TOO_FREQUENT, resend the same request with a different id
-            # - if it failed with a known API exception, return the error
-            # - if it fails for any other reason, raise the exception
-            try:
-                fut = asyncio.wait_for(
-                    self.__ws_recv_gdvars(), timeout=(self.command_timeout_msec / 1000)
-                )
-                ret = asyncio.get_event_loop().run_until_complete(fut)
-                returned_request_id, statuscode, value = self.__check_response_format(
-                    command_id, ret
-                )
-                if returned_request_id == request_id or returned_request_id == 0:
-                    self.__check_status_code(command_id, statuscode, value)
-                    value = self.__cast_return_type(command_id, inner_ret_type, value)
-                    return value
-            except TimeoutError:
-                retry_count -= 1
-                logger.warning(f"command {command_id.name} timed out, retrying")
-            except ApiException as e:
-                if e.code == StatusCode.TOO_FREQUENT:
-                    should_resend = True
-                elif e.code == StatusCode.NOT_STARTED or e.code == StatusCode.PAUSED:
-                    time.sleep(
-                        0.1
-                    )  # poll the game every 0.1 second until it starts again
-                    should_resend = True
+            if metrics is not None:
+                counters["errors"] += 1
+            raise ApiException(
+                command_id,
+                StatusCode.CLIENT_ERR,
+                f"command {command_id.name} timed out, retry limit {max_retries} exceeded",
+            )
+        finally:
+            # a reply that arrives after every command waiting for it gave up is dropped
+            holders = self._request_holders
+            for request_id in held:
+                left = holders.pop(request_id, 1) - 1
+                if left:
+                    holders[request_id] = left
                 else:
-                    return e
-            except Exception as e:
-                raise ApiException(
-                    command_id, StatusCode.CLIENT_ERR, f"unexpected error\nwhat: {e}"
-                )
-        raise ApiException(
-            command_id,
-            StatusCode.CLIENT_ERR,
-            f"command {command_id.name} timed out, retry limit {self.retry_count} exceeded",
+                    self._pending.pop(request_id, None)
+            if metrics is not None:
+                metrics.record(command_id, "total", time.perf_counter() - started)
+
+
+class GameCommand:
+    """
+    A command declared with `game_command`, shared by the sync and async clients.
+
+    Everything a call needs is worked out once here: the default values of
+    the arguments, a check of the argument types generated for the declared
+    types, and the wrappers installed on the client classes.
+    """
+
+    def __init__(
+        self,
+        fn: Callable,
+        command_id: CommandType,
+        arg_types: list[type],
+        inner_ret_type: type | None,
+    ) -> None:
+        self.name = fn.__name__
+        self.command_id = command_id
+        self.arg_types = arg_types
+        self.inner_ret_type = inner_ret_type
+        self.signature = inspect.signature(fn)
+        parameters = list(self.signature.parameters.values())[1:]
+        self.param_names = [param.name for param in parameters]
+        self.required = sum(
+            param.default is inspect.Parameter.empty for param in parameters
+        )
+        self.defaults = [param.default for param in parameters[self.required :]]
+        self.check_args = _compile_arg_check(command_id, arg_types)
+
+    def bind(self, args: tuple) -> list[Any]:
+        """Fills in the default values of the arguments left out."""
+        given = len(args)
+        if given < self.required:
+            raise self.missing(self.param_names[given])
+        return [*args, *self.defaults[given - self.required :]]
+
+    def missing(self, name: str) -> ApiException:
+        return ApiException(
+            self.command_id,
+            StatusCode.ILLFORMED_COMMAND,
+            f"{self.command_id.name} expected argument {name}",
+        )
+
+    def compile_wrapper(self, fn: Callable, is_async: bool) -> Callable:
+        """
+        Generates the method of the command: the arguments are taken as
+        positional parameters, with the defaults bound at definition, checked
+        unless the client is `trusted`, and sent without further checks.
+        """
+        params = []
+        for i, name in enumerate(self.param_names):
+            default = (
+                "_MISSING" if i < self.required else f"_defaults[{i - self.required}]"
+            )
+            params.append(f"{name}={default}")
+        missing = "".join(
+            f"    if {name} is _MISSING:\n        raise _command.missing({name!r})\n"
+            for name in self.param_names[: self.required]
         )
+        if is_async:
+            head = "async def"
+            call = "await _client._send_command"
+        else:
+            head = "def"
+            call = "_client.await_send_command"
+        source = (
+            f"{head} {self.name}(_client, {''.join(p + ', ' for p in params)}/, *_extra, **_options):\n"
+            f"{missing}"
+            f"    _args = [{''.join(name + ', ' for name in self.param_names)}]\n"
+            "    if _extra:\n"
+            "        _args.extend(_extra)\n"
+            "    if not _client.trusted:\n"
+            "        _error = _check_args(_args)\n"
+            "        if _error is not None:\n"
+            "            return _error\n"
+            f"    return {call}(_command_id, _args, _arg_types, _ret_type, checked=True, **_options)\n"
+        )
+        namespace = {
+            "_MISSING": _MISSING,
+            "_defaults": self.defaults,
+            "_command": self,
+            "_check_args": self.check_args,
+            "_command_id": self.command_id,
+            "_arg_types": self.arg_types,
+            "_ret_type": self.inner_ret_type,
+        }
+        exec(source, namespace)
+        wrapped = functools.wraps(fn)(namespace[self.name])
+        wrapped.game_command = self  # type: ignore[attr-defined]
+        return wrapped
+
+
+_MISSING: Any = object()
+
+
+def _compile_arg_check(
+    command_id: CommandType, arg_types: list[type]
+) -> Callable[[list[Any]], ApiException | None]:
+    """
+    Generates a check of the argument types of a command, the unrolled
+    equivalent of `__check_arg_types` that returns the error instead of raising it.
+    """
+    checks = "".join(
+        f"    if not isinstance(args[{i}], _arg_types[{i}]):\n"
+        f"        return _ApiException(_command_id, _ILLEGAL_ARGUMENT, {f'type mismatch at argument {i} of {command_id.name}'!r})\n"
+        for i in range(len(arg_types))
+    )
+    source = (
+        "def check_args(args):\n"
+        f"    if len(args) != {len(arg_types)}:\n"
+        f"        return _ApiException(_command_id, _ILLFORMED_COMMAND, {f'{command_id.name} expected {len(arg_types)} arguments, got '!r} + str(len(args)))\n"
+        f"{checks}"
+        "    return None\n"
+    )
+    namespace = {
+        "_ApiException": ApiException,
+        "_ILLEGAL_ARGUMENT": StatusCode.ILLEGAL_ARGUMENT,
+        "_ILLFORMED_COMMAND": StatusCode.ILLFORMED_COMMAND,
+        "_command_id": command_id,
+        "_arg_types": tuple(arg_types),
+    }
+    exec(source, namespace)
+    return namespace["check_args"]
 
 
 # decorator for command handlers
 # the decorated function itself is just a dummy function that never gets called
+# the wrapper also takes the keyword options `priority`, `deadline` and `bypass_cache`
+# the command is kept as `wrapped.game_command` for AsyncGameClient
 def game_command(
     command_id: CommandType, arg_types: list[type], inner_ret_type: type | None
 ) -> Callable:
     def decorator(fn: Callable) -> Callable:
-        sig = inspect.signature(fn)
-
-        def wrapped(client: GameClientBase, *args) -> Any:
-            full_args = list(args)
-            parameters = list(sig.parameters.values())[1:]
-            for i in range(len(full_args), len(parameters)):
-                param = parameters[i]
-                if param.default is inspect.Parameter.empty:
-                    raise ApiException(
-                        command_id,
-                        StatusCode.ILLFORMED_COMMAND,
-                        f"{command_id.name} expected argument {param.name}",
-                    )
-                full_args.append(param.default)
-            return client.await_send_command(
-                command_id, list(full_args), arg_types, inner_ret_type
-            )
-
-        return wrapped
+        command = GameCommand(fn, command_id, arg_types, inner_ret_type)
+        return command.compile_wrapper(fn, is_async=False)
 
     return decorator
@@ -0,0 +1,303 @@
+import asyncio
+import time
+from types import MappingProxyType
+from typing import Any, Callable
+
+from .constants import EnemyType, SpellType
+from .game_client import GameClient
+from .game_client_base import GameClientBase
+from .logger import logger
+from .structures import ApiException
+
+
+class GameSnapshot:
+    """
+    某個時間點的遊戲狀態，建立後不會再改變，讀取不需要任何網路通訊。
+
+    尚未取得的欄位為 `None`。每次有欄位改變時，`GameState` 會發布一個
+    `version` 加一的新快照。
+    """
+
+    __slots__ = (
+        "version",
+        "time",
+        "updated",
+        "money",
+        "income",
+        "scores",
+        "wave",
+        "remain_time",
+        "towers",
+        "enemies",
+        "spell_cooldowns",
+        "unit_cooldowns",
+    )
+
+    version: int
+    """快照的版本，從 0 開始，每次發布加一。"""
+    time: float
+    """發布快照時的 `time.monotonic()`。"""
+    updated: MappingProxyType
+    """每個欄位最後一次改變時的 `time.monotonic()`。"""
+    money: int | None
+    """玩家的金錢。"""
+    income: int | None
+    """玩家的收入。"""
+    scores: int | None
+    """玩家的分數。"""
+    wave: int | None
+    """目前的波數。"""
+    remain_time: float | None
+    """遊戲剩餘的秒數。"""
+    towers: tuple | None
+    """玩家的所有防禦塔 (`Tower`)。"""
+    enemies: tuple | None
+    """自己地圖上的所有敵人 (`Enemy`)。"""
+    spell_cooldowns: MappingProxyType | None
+    """每種法術 (`SpellType`) 剩餘的冷卻秒數。"""
+    unit_cooldowns: MappingProxyType | None
+    """每種單位 (`EnemyType`) 剩餘的派遣冷卻秒數。"""
+
+    def __init__(self, version: int, fields: dict[str, Any], updated: dict) -> None:
+        set_field = object.__setattr__
+        set_field(self, "version", version)
+        set_field(self, "time", time.monotonic())
+        set_field(self, "updated", MappingProxyType(dict(updated)))
+        for name in _FEEDS:
+            set_field(self, name, fields.get(name))
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError("GameSnapshot is immutable")
+
+    def __repr__(self) -> str:
+        return f"GameSnapshot(version={self.version}, money={self.money}, enemies={len(self.enemies or ())})"
+
+
+class _Feed:
+    """A snapshot field, the commands it is read with and how often."""
+
+    def __init__(
+        self,
+        calls: list[tuple[str, tuple]],
+        fastest: float,
+        slowest: float,
+        combine: Callable[[list[Any]], Any],
+    ) -> None:
+        self.calls = [
+            (getattr(GameClient, name).game_command, args) for name, args in calls
+        ]
+        self.fastest = fastest
+        self.slowest = slowest
+        self.combine = combine
+
+
+def _first(values: list[Any]) -> Any:
+    return values[0]
+
+
+def _as_tuple(values: list[Any]) -> tuple:
+    return tuple(values[0])
+
+
+def _by_type(types: list) -> Callable[[list[Any]], MappingProxyType]:
+    return lambda values: MappingProxyType(dict(zip(types, values)))
+
+
+_FEEDS: dict[str, _Feed] = {
+    "money": _Feed([("get_money", (True,))], 0.05, 0.5, _first),
+    "income": _Feed([("get_income", (True,))], 0.2, 2.0, _first),
+    "scores": _Feed([("get_scores", (True,))], 0.2, 2.0, _first),
+    "wave": _Feed([("get_current_wave", ())], 0.2, 2.0, _first),
+    "remain_time": _Feed([("get_remain_time", ())], 1.0, 1.0, _first),
+    "towers": _Feed([("get_all_towers", (True,))], 0.1, 1.0, _as_tuple),
+    "enemies": _Feed([("get_all_enemies", (True,))], 0.05, 0.5, _as_tuple),
+    "spell_cooldowns": _Feed(
+        [("get_spell_cooldown", (True, spell)) for spell in SpellType],
+        0.25,
+        2.0,
+        _by_type(list(SpellType)),
+    ),
+    "unit_cooldowns": _Feed(
+        [("get_unit_cooldown", (unit,)) for unit in EnemyType],
+        0.5,
+        2.0,
+        _by_type(list(EnemyType)),
+    ),
+}
+
+
+def _fingerprint(value: Any) -> Any:
+    # towers and enemies are fresh objects on every poll, compare what they show
+    if isinstance(value, tuple):
+        return tuple(map(repr, value))
+    return value
+
+
+class GameState:
+    """
+    # Game State
+    在背景持續查詢遊戲狀態，並發布不可變的 `GameSnapshot`。
+
+    每個欄位有自己的查詢頻率：數值改變時加快（例如敵人正在移動、金錢正在
+    變化），沒有變化時逐漸放慢。`snapshot` 永遠是最新的快照，讀取它不會
+    送出任何指令。
+
+    所有欄位合計每秒送出的指令數不會超過 client 發送頻率上限的 `budget`
+    倍（預設一半），其餘留給 bot 自己的指令；需要時最快的查詢間隔會等比例
+    放慢。
+
+    ## Example
+    ```python
+    async with AsyncGameClient(port, token) as agent:
+        state = GameState(agent).start()
+
+        @state.on_change
+        def react(snapshot, changed):
+            if "enemies" in changed:
+                print(len(snapshot.enemies))
+
+        await asyncio.sleep(60)
+        state.stop()
+    ```
+
+    使用 `GameClient(..., loop_thread=True)` 時，可以在任何執行緒呼叫
+    `start()`，快照同樣可以在任何執行緒讀取。回呼函數在 client 的 I/O
+    執行緒執行，不能在其中呼叫會阻塞的指令。
+    """
+
+    def __init__(
+        self,
+        client: GameClientBase,
+        intervals: dict[str, tuple[float, float]] | None = None,
+        budget: float = 0.5,
+    ) -> None:
+        if not 0 < budget <= 1:
+            raise ValueError("budget must be in (0, 1]")
+        self.client = client
+        # the share of the client's send rate the polls may use at most
+        self.budget = budget
+        # field -> (fastest, slowest) poll interval in seconds
+        self.intervals = {
+            name: (feed.fastest, feed.slowest) for name, feed in _FEEDS.items()
+        }
+        for name, interval in (intervals or {}).items():
+            if name not in _FEEDS:
+                raise ValueError(f"GameState has no field {name}")
+            self.intervals[name] = interval
+        self.snapshot = GameSnapshot(0, {}, {})
+        self._fields: dict[str, Any] = {}
+        self._fingerprints: dict[str, Any] = {}
+        self._updated: dict[str, float] = {}
+        self._callbacks: list[Callable[[GameSnapshot, frozenset[str]], Any]] = []
+        self._tasks: list[asyncio.Task] = []
+
+    def on_change(
+        self, callback: Callable[[GameSnapshot, frozenset[str]], Any]
+    ) -> Callable[[GameSnapshot, frozenset[str]], Any]:
+        """Calls `callback(snapshot, changed_fields)` for every new snapshot."""
+        self._callbacks.append(callback)
+        return callback
+
+    def remove_callback(
+        self, callback: Callable[[GameSnapshot, frozenset[str]], Any]
+    ) -> None:
+        self._callbacks.remove(callback)
+
+    def start(self) -> "GameState":
+        """
+        Starts polling on the event loop of the client: from a coroutine of an
+        `AsyncGameClient`, or from any thread for a client with `loop_thread=True`.
+        """
+        loop = self.client._loop
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self.__create_tasks()
+        elif running is None and self.client._loop_thread is not None:
+            loop.call_soon_threadsafe(self.__create_tasks)
+        else:
+            raise RuntimeError(
+                "GameState polls on the event loop of its client, start it from a coroutine of an AsyncGameClient or use a GameClient with loop_thread=True"
+            )
+        return self
+
+    def __create_tasks(self) -> None:
+        self._tasks = [
+            self.client._loop.create_task(self.__poll(name, feed))
+            for name, feed in _FEEDS.items()
+        ]
+
+    def stop(self) -> None:
+        """Stops polling; the last snapshot stays available."""
+        loop = self.client._loop
+        for task in self._tasks:
+            loop.call_soon_threadsafe(task.cancel)
+        self._tasks = []
+
+    async def __fetch(self, feed: _Feed) -> Any:
+        values = await asyncio.gather(
+            *(
+                self.client._send_command(
+                    command.command_id,
+                    command.bind(args),
+                    command.arg_types,
+                    command.inner_ret_type,
+                )
+                for command, args in feed.calls
+            )
+        )
+        for value in values:
+            if isinstance(value, ApiException):
+                raise value
+        return feed.combine(values)
+
+    def __slowdown(self) -> float:
+        """How much the fastest intervals are stretched to keep within the budget."""
+        limiter = self.client.rate_limiter
+        # the limiter's current (learned) rate, or the server's documented limit
+        rate = getattr(limiter, "rate", 1000 / self.client.COMMAND_RATE_LIMIT_MSEC)
+        fastest_rate = sum(
+            len(feed.calls) / self.intervals[name][0] for name, feed in _FEEDS.items()
+        )
+        return max(1.0, fastest_rate / (self.budget * rate))
+
+    async def __poll(self, name: str, feed: _Feed) -> None:
+        interval = self.intervals[name][0]
+        while True:
+            fastest, slowest = self.intervals[name]
+            fastest *= self.__slowdown()
+            slowest = max(slowest, fastest)
+            interval = min(slowest, max(fastest, interval))
+            started = time.monotonic()
+            try:
+                value = await self.__fetch(feed)
+            except Exception as e:
+                logger.warning(f"GameState failed to update {name}: {e}")
+                interval = slowest
+            else:
+                if self.__publish(name, value):
+                    interval = max(fastest, interval / 2)
+                else:
+                    interval = min(slowest, interval * 1.5)
+            await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+    def __publish(self, name: str, value: Any) -> bool:
+        """Records a polled value, publishes a new snapshot if it changed."""
+        fingerprint = _fingerprint(value)
+        if name in self._fields and self._fingerprints[name] == fingerprint:
+            return False
+        self._updated[name] = time.monotonic()
+        self._fields[name] = value
+        self._fingerprints[name] = fingerprint
+        self.snapshot = GameSnapshot(
+            self.snapshot.version + 1, self._fields, self._updated
+        )
+        changed = frozenset((name,))
+        for callback in list(self._callbacks):
+            try:
+                callback(self.snapshot, changed)
+            except Exception as e:
+                logger.error(f"GameState callback {callback} failed: {e}")
+        return True
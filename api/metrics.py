@@ -0,0 +1,279 @@
+import math
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+from .constants import CommandType
+from .logger import logger
+
+# where the time of a command goes, each with its own histogram
+PHASES = ("rate_limit_wait", "round_trip", "decode", "cast", "total")
+COUNTERS = (
+    "calls",
+    "sent",
+    "retries",
+    "hedges",
+    "timeouts",
+    "too_frequent",
+    "not_started_waits",
+    "replays",
+    "errors",
+    "bytes_out",
+    "bytes_in",
+)
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+class LatencyHistogram:
+    """
+    Log-linear histogram of durations, in the manner of HdrHistogram.
+
+    Durations are counted in microseconds: values below `2**sub_bucket_bits`
+    get a bucket each, larger ones share `2**(sub_bucket_bits-1)` buckets per
+    power of two. Quantiles are thus within `2**(1-sub_bucket_bits)` of the
+    recorded value (1.6% by default) while the memory stays bounded.
+    """
+
+    def __init__(self, sub_bucket_bits: int = 7) -> None:
+        if sub_bucket_bits < 2:
+            raise ValueError("sub_bucket_bits must be at least 2")
+        self.sub_bucket_bits = sub_bucket_bits
+        self._sub_buckets = 1 << sub_bucket_bits
+        self._half = self._sub_buckets >> 1
+        self._counts: dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def __bucket(self, micros: int) -> int:
+        if micros < self._sub_buckets:
+            return micros
+        shift = micros.bit_length() - self.sub_bucket_bits
+        return (
+            self._sub_buckets
+            + (shift - 1) * self._half
+            + (micros >> shift)
+            - self._half
+        )
+
+    def __bucket_value(self, bucket: int) -> float:
+        """The middle of a bucket, in microseconds."""
+        if bucket < self._sub_buckets:
+            return float(bucket)
+        shift, offset = divmod(bucket - self._sub_buckets, self._half)
+        shift += 1
+        return ((offset + self._half) << shift) + ((1 << shift) - 1) / 2
+
+    def record(self, seconds: float) -> None:
+        bucket = self.__bucket(max(0, int(seconds * 1e6)))
+        self._counts[bucket] = self._counts.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """The duration in seconds below which a fraction `q` of the records fall."""
+        if self.count == 0:
+            return 0.0
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for bucket in sorted(self._counts):
+            seen += self._counts[bucket]
+            if seen >= rank:
+                value = self.__bucket_value(bucket) / 1e6
+                return min(self.max, max(self.min, value))
+        return self.max
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def snapshot(self) -> dict[str, float]:
+        snapshot = {
+            "count": self.count,
+            "mean": self.mean(),
+            "min": self.min if self.count else 0.0,
+            "max": self.max,
+        }
+        for q in QUANTILES:
+            snapshot[f"p{q * 100:g}"] = self.quantile(q)
+        return snapshot
+
+
+class CommandMetrics:
+    """The histograms and counters of one command type."""
+
+    __slots__ = ("histograms", "counters")
+
+    def __init__(self) -> None:
+        self.histograms = {phase: LatencyHistogram() for phase in PHASES}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            **self.counters,
+            **{
+                phase: histogram.snapshot()
+                for phase, histogram in self.histograms.items()
+                if histogram.count
+            },
+        }
+
+
+class ClientMetrics:
+    """
+    Latency histograms by phase and counters, per `CommandType`.
+
+    The phases of a command are `rate_limit_wait` (waiting for the rate
+    limiter before a send), `round_trip` (from the send to its reply),
+    `decode` of the reply, `cast` (checking the reply and casting its
+    value) and `total` (the whole call, resends included). Durations are in seconds on `time.perf_counter()`.
+    """
+
+    def __init__(self) -> None:
+        self._commands: dict[CommandType, CommandMetrics] = {}
+
+    def command(self, command_id: CommandType) -> CommandMetrics:
+        metrics = self._commands.get(command_id)
+        if metrics is None:
+            metrics = self._commands[command_id] = CommandMetrics()
+        return metrics
+
+    def record(self, command_id: CommandType, phase: str, seconds: float) -> None:
+        self.command(command_id).histograms[phase].record(seconds)
+
+    def count(self, command_id: CommandType, counter: str, n: int = 1) -> None:
+        self.command(command_id).counters[counter] += n
+
+    def reset(self) -> None:
+        self._commands = {}
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        """The metrics of every command used so far, by command name."""
+        # copied first, the client may add commands from its I/O thread
+        return {
+            command_id.name: metrics.snapshot()
+            for command_id, metrics in list(self._commands.items())
+        }
+
+    def to_text(self) -> str:
+        """The metrics in the Prometheus text format."""
+        lines = ["# TYPE gameclient_command_seconds summary"]
+        counters: dict[str, list[str]] = {counter: [] for counter in COUNTERS}
+        for command_id, metrics in list(self._commands.items()):
+            command = command_id.name
+            for phase, histogram in metrics.histograms.items():
+                if not histogram.count:
+                    continue
+                labels = f'command="{command}",phase="{phase}"'
+                for q in QUANTILES:
+                    lines.append(
+                        f'gameclient_command_seconds{{{labels},quantile="{q:g}"}} {histogram.quantile(q):.9f}'
+                    )
+                lines.append(
+                    f"gameclient_command_seconds_sum{{{labels}}} {histogram.total:.9f}"
+                )
+                lines.append(
+                    f"gameclient_command_seconds_count{{{labels}}} {histogram.count}"
+                )
+            for counter, value in metrics.counters.items():
+                counters[counter].append(
+                    f'gameclient_command_{counter}_total{{command="{command}"}} {value}'
+                )
+        # the samples of a metric follow its TYPE line
+        for counter, samples in counters.items():
+            lines.append(f"# TYPE gameclient_command_{counter}_total counter")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    """
+    Exports `ClientMetrics` as text, from a background thread.
+
+    With `path`, the file is rewritten every `interval` seconds (atomically,
+    through a temporary file). With `port`, the metrics are served over
+    HTTP on `host:port`, e.g. for Prometheus. Stop it with `stop()`.
+    """
+
+    def __init__(
+        self,
+        metrics: ClientMetrics,
+        path: str | None = None,
+        port: int | None = None,
+        interval: float = 5.0,
+        host: str = "127.0.0.1",
+    ) -> None:
+        if path is None and port is None:
+            raise ValueError("MetricsExporter needs a path or a port")
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._threads: list[threading.Thread] = []
+        self._server: ThreadingHTTPServer | None = None
+        if path is not None:
+            self._threads.append(
+                threading.Thread(
+                    target=self.__write_loop, name="metrics writer", daemon=True
+                )
+            )
+        if port is not None:
+            self._server = ThreadingHTTPServer((host, port), self.__handler())
+            self._threads.append(
+                threading.Thread(
+                    target=self._server.serve_forever,
+                    name="metrics server",
+                    daemon=True,
+                )
+            )
+        for thread in self._threads:
+            thread.start()
+
+    def __handler(self) -> type[BaseHTTPRequestHandler]:
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                body = metrics.to_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        return Handler
+
+    def write(self) -> None:
+        assert self.path is not None
+        temp = f"{self.path}.tmp"
+        with open(temp, "w") as file:
+            file.write(self.metrics.to_text())
+        os.replace(temp, self.path)
+
+    def __write_loop(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                self.write()
+            except OSError as e:
+                logger.warning(f"failed to write metrics to {self.path}: {e}")
+
+    def stop(self) -> None:
+        """Stops exporting; a file gets its final metrics."""
+        self._stopped.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        for thread in self._threads:
+            thread.join()
+        if self.path is not None:
+            self.write()
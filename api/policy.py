@@ -0,0 +1,105 @@
+import random
+
+from .constants import CommandType, WRITE_COMMANDS
+
+
+class CommandPolicy:
+    """
+    How long a command waits for its reply and what it does when it does not come.
+
+    `timeout` is the wait in seconds for each attempt (None: the client's
+    `command_timeout_msec`), `max_retries` the number of timeouts tolerated
+    (None: the client's `retry_count`). After a timeout the command keeps
+    waiting for the same request, or with `resend_on_timeout` also sends it
+    again with a new id, after a backoff of `backoff * 2**(attempt-1)`
+    seconds (at most `max_backoff`, shortened by a random factor of up to
+    `jitter`); the first reply of any of its requests is taken.
+
+    With `hedge_after`, a read with no reply after that many seconds is sent
+    once more right away, without waiting for the timeout.
+
+    Writes can neither be resent nor hedged: they could be applied twice.
+    """
+
+    def __init__(
+        self,
+        timeout: float | None = None,
+        max_retries: int | None = None,
+        resend_on_timeout: bool = False,
+        backoff: float = 0.0,
+        max_backoff: float = 1.0,
+        jitter: float = 0.5,
+        hedge_after: float | None = None,
+    ) -> None:
+        if timeout is not None and timeout <= 0:
+            raise ValueError("timeout must be positive")
+        if max_retries is not None and max_retries <= 0:
+            raise ValueError("max_retries must be positive")
+        if backoff < 0 or max_backoff < backoff:
+            raise ValueError("backoff must be in [0, max_backoff]")
+        if not 0 <= jitter < 1:
+            raise ValueError("jitter must be in [0, 1)")
+        if hedge_after is not None and hedge_after <= 0:
+            raise ValueError("hedge_after must be positive")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.resend_on_timeout = resend_on_timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.hedge_after = hedge_after
+
+    def replace(self, **changes: object) -> "CommandPolicy":
+        """A copy of this policy with some of its settings changed."""
+        return CommandPolicy(**{**vars(self), **changes})  # type: ignore[arg-type]
+
+    def backoff_delay(self, attempt: int) -> float:
+        if self.backoff == 0:
+            return 0.0
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        return delay * random.uniform(1 - self.jitter, 1)
+
+    def check(self, command_id: CommandType) -> None:
+        """Raises ValueError if the policy could apply the command twice."""
+        if command_id in WRITE_COMMANDS and (
+            self.resend_on_timeout or self.hedge_after is not None
+        ):
+            raise ValueError(
+                f"{command_id.name} changes the game state and cannot be resent or hedged"
+            )
+
+    def __repr__(self) -> str:
+        settings = ", ".join(f"{name}={value!r}" for name, value in vars(self).items())
+        return f"CommandPolicy({settings})"
+
+
+# cheap reads polled every tick: a lost reply costs a short wait and a resend
+_FAST_READ = CommandPolicy(
+    timeout=0.25, resend_on_timeout=True, backoff=0.01, max_backoff=0.1
+)
+# large replies: the client's timeout, then a resend
+_SLOW_READ = CommandPolicy(resend_on_timeout=True, backoff=0.05)
+
+# opt-in policies for bots that poll every tick and would rather resend a read
+# than wait for a lost reply, e.g. `GameClient(..., policies=FAST_RESEND_POLICIES)`;
+# the cheap reads then wait 0.25 s per attempt whatever `command_timeout_msec` is.
+# Without them, every command keeps the client's timeout and retry count.
+FAST_RESEND_POLICIES: dict[CommandType, CommandPolicy] = {
+    CommandType.GET_SCORES: _FAST_READ,
+    CommandType.GET_CURRENT_WAVE: _FAST_READ,
+    CommandType.GET_REMAIN_TIME: _FAST_READ,
+    CommandType.GET_TIME_UNTIL_NEXT_WAVE: _FAST_READ,
+    CommandType.GET_MONEY: _FAST_READ,
+    CommandType.GET_INCOME: _FAST_READ,
+    CommandType.GET_GAME_STATUS: _FAST_READ,
+    CommandType.GET_TERRAIN: _FAST_READ,
+    CommandType.GET_TOWER: _FAST_READ,
+    CommandType.GET_UNIT_COOLDOWN: _FAST_READ,
+    CommandType.GET_SPELL_COOLDOWN: _FAST_READ,
+    CommandType.GET_ALL_TOWERS: _FAST_READ,
+    CommandType.GET_ALL_ENEMIES: _FAST_READ,
+    CommandType.GET_ALL_TERRAIN: _SLOW_READ,
+    CommandType.GET_SYSTEM_PATH: _SLOW_READ,
+    CommandType.GET_OPPONENT_PATH: _SLOW_READ,
+    CommandType.GET_CHAT_HISTORY: _SLOW_READ,
+}
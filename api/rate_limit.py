@@ -0,0 +1,154 @@
+import asyncio
+import time
+from collections import deque
+
+
+class RateLimiter:
+    """
+    Decides when the client may send its next request.
+
+    `acquire` is awaited before every send, one send at a time. The client
+    reports the outcome of every reply: `on_rejected` for `TOO_FREQUENT`,
+    `on_accepted` for any other status.
+    """
+
+    async def acquire(self) -> None:
+        raise NotImplementedError
+
+    def on_accepted(self) -> None:
+        pass
+
+    def on_rejected(self) -> None:
+        pass
+
+    def stats(self) -> dict[str, float]:
+        return {}
+
+
+class TokenBucketRateLimiter(RateLimiter):
+    """
+    A token bucket on the monotonic clock that learns the server's limit.
+
+    Tokens refill at `rate` per second up to `burst`; every send takes one.
+    With `adaptive`, a `TOO_FREQUENT` reply multiplies the rate by
+    `backoff` (but not below `min_rate`) and empties the bucket, and every
+    `probe_after` accepted replies in a row raise it by `probe_step` (but
+    not above `max_rate`), so the rate settles just under the server's limit.
+
+    The rate at the last rejection is kept as `learned_limit`, and probing
+    stops at `limit_margin` times it instead of crossing it again. Every
+    `relax_after` probes held back by that cap raise `learned_limit` by
+    `probe_step`, so a server that allows more is found out slowly.
+    """
+
+    def __init__(
+        self,
+        rate: float = 100.0,
+        burst: int = 1,
+        adaptive: bool = True,
+        min_rate: float = 10.0,
+        max_rate: float = 200.0,
+        backoff: float = 0.9,
+        probe_step: float = 1.0,
+        probe_after: int = 20,
+        limit_margin: float = 0.98,
+        relax_after: int = 10,
+    ) -> None:
+        if not 0 < min_rate <= rate <= max_rate:
+            raise ValueError("rate must be within [min_rate, max_rate] and positive")
+        if burst < 1:
+            raise ValueError("burst must be at least 1")
+        if not 0 < backoff < 1:
+            raise ValueError("backoff must be between 0 and 1")
+        if not 0 < limit_margin <= 1:
+            raise ValueError("limit_margin must be in (0, 1]")
+        if relax_after < 1:
+            raise ValueError("relax_after must be at least 1")
+        self.rate = rate
+        self.burst = burst
+        self.adaptive = adaptive
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.backoff = backoff
+        self.probe_step = probe_step
+        self.probe_after = probe_after
+        self.limit_margin = limit_margin
+        self.relax_after = relax_after
+
+        # the first send never waits
+        self._tokens = 1.0
+        self._updated = time.monotonic()
+        self._accepted_in_row = 0
+        self._capped_probes = 0
+        # send times of the last requests, for the effective rate
+        self._sent: deque[float] = deque(maxlen=100)
+        self.acquired = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.rejections = 0
+        # the rate at the last rejection, the best guess of the server's limit
+        self.learned_limit: float | None = None
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        now = time.monotonic()
+        self._refill(now)
+        if self._tokens < 1:
+            self.waits += 1
+            started = now
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                now = time.monotonic()
+                self._refill(now)
+            self.wait_time += now - started
+        self._tokens -= 1
+        self.acquired += 1
+        self._sent.append(now)
+
+    def on_accepted(self) -> None:
+        if not self.adaptive:
+            return
+        self._accepted_in_row += 1
+        if self._accepted_in_row >= self.probe_after:
+            self._accepted_in_row = 0
+            cap = self.max_rate
+            if self.learned_limit is not None:
+                # stay under the known limit, and relax it now and then
+                cap = min(cap, self.learned_limit * self.limit_margin)
+                if self.rate + self.probe_step > cap:
+                    self._capped_probes += 1
+                    if self._capped_probes >= self.relax_after:
+                        self._capped_probes = 0
+                        self.learned_limit += self.probe_step
+            self.rate = max(self.rate, min(cap, self.rate + self.probe_step))
+
+    def on_rejected(self) -> None:
+        self.rejections += 1
+        if not self.adaptive:
+            return
+        self._accepted_in_row = 0
+        self._capped_probes = 0
+        self.learned_limit = self.rate
+        self.rate = max(self.min_rate, self.rate * self.backoff)
+        self._tokens = 0.0
+        self._updated = time.monotonic()
+
+    def effective_rate(self) -> float:
+        """Sends per second over the last 100 sends."""
+        if len(self._sent) < 2 or self._sent[-1] == self._sent[0]:
+            return 0.0
+        return (len(self._sent) - 1) / (self._sent[-1] - self._sent[0])
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "rate": self.rate,
+            "effective_rate": self.effective_rate(),
+            "learned_limit": self.learned_limit or 0.0,
+            "acquired": self.acquired,
+            "waits": self.waits,
+            "wait_time": self.wait_time,
+            "rejections": self.rejections,
+        }
@@ -0,0 +1,38 @@
+import random
+
+
+class ReconnectPolicy:
+    """
+    Backoff between the attempts to reconnect after the connection dropped.
+
+    The first attempt is immediate; attempt `n` waits `base_delay * 2**(n-1)`
+    seconds, at most `max_delay`, shortened by a random factor of up to
+    `jitter`. By default the client keeps trying, every `max_delay`
+    seconds at most. With `max_attempts`, it gives up after that many
+    failed attempts: the commands fail until the next one starts a new
+    round of attempts.
+    """
+
+    def __init__(
+        self,
+        base_delay: float = 0.1,
+        max_delay: float = 5.0,
+        jitter: float = 0.5,
+        max_attempts: int | None = None,
+    ) -> None:
+        if base_delay <= 0 or max_delay < base_delay:
+            raise ValueError("delays must be positive with base_delay <= max_delay")
+        if not 0 <= jitter < 1:
+            raise ValueError("jitter must be in [0, 1)")
+        if max_attempts is not None and max_attempts <= 0:
+            raise ValueError("max_attempts must be positive")
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.max_attempts = max_attempts
+
+    def delay(self, attempt: int) -> float:
+        if attempt == 0:
+            return 0.0
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return delay * random.uniform(1 - self.jitter, 1)
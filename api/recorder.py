@@ -0,0 +1,292 @@
+import atexit
+import queue
+import struct
+import threading
+import time
+from typing import Any, BinaryIO, Iterable, Iterator
+
+from .constants import CommandType
+from .logger import logger
+from .serialization import bytes_to_var
+
+# file header: magic, wall clock time and monotonic time at the start of the recording
+_MAGIC = b"GCTRAF\x00\x02"
+_HEADER = struct.Struct("<dd")
+# record header: frame length, seconds since the start, request id, command, kind
+_RECORD = struct.Struct("<IdqHB")
+# index entry: first and last time, offset and length of a block, its commands
+_INDEX_MAGIC = b"GCTIDX\x00\x01"
+_INDEX = struct.Struct("<ddQQQ")
+
+SENT = 0
+RECEIVED = 1
+# the frame was a text message, stored as UTF-8
+_TEXT = 2
+
+# every command has a bit in the command mask of an index entry
+_COMMAND_BITS = {command_id: 1 << i for i, command_id in enumerate(CommandType)}
+_ALL_COMMANDS = (1 << 64) - 1
+
+_STOP = object()
+
+
+class TrafficRecorder:
+    """
+    Records every command frame a client sends and receives to a binary log.
+
+    Each frame is appended with its time (seconds since the recording
+    started, on the monotonic clock), its request id and `CommandType`, as
+    a length-prefixed record. The command path only puts the frame in a
+    queue; a background thread packs the records and writes them in
+    buffered blocks.
+
+    Every block (at most `block_seconds` seconds or `block_bytes` bytes of
+    records) gets an entry in the index file `path + ".idx"`, with its time
+    range and the commands in it, so `TrafficLog` can seek by time and by
+    command in the recording of a whole match. The authentication frames
+    are never recorded.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        block_seconds: float = 1.0,
+        block_bytes: int = 1 << 16,
+    ) -> None:
+        if block_seconds <= 0 or block_bytes <= 0:
+            raise ValueError("blocks must have a positive size")
+        self.path = path
+        self.block_seconds = block_seconds
+        self.block_bytes = block_bytes
+        self._started = time.monotonic()
+        self._file: BinaryIO = open(path, "wb")
+        self._file.write(_MAGIC + _HEADER.pack(time.time(), self._started))
+        self._index: BinaryIO = open(path + ".idx", "wb")
+        self._index.write(_INDEX_MAGIC)
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self.records = 0
+        self.bytes_written = 0
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self.__write_loop, name="traffic recorder", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record(
+        self,
+        kind: int,
+        request_id: int | None,
+        command_id: CommandType | None,
+        frame: str | bytes,
+    ) -> None:
+        """Queues a frame; `kind` is `SENT` or `RECEIVED`."""
+        self._queue.put(
+            (time.monotonic(), kind, request_id or 0, command_id or 0, frame)
+        )
+
+    def __write_loop(self) -> None:
+        block = bytearray()
+        block_offset = self._file.tell()
+        first = last = 0.0
+        commands = 0
+        while True:
+            try:
+                item = self._queue.get(timeout=self.block_seconds)
+            except queue.Empty:
+                item = None
+            if item is not None and item is not _STOP:
+                recorded_at, kind, request_id, command_id, frame = item
+                try:
+                    if isinstance(frame, str):
+                        frame = frame.encode()
+                        kind |= _TEXT
+                    at = recorded_at - self._started
+                    header = _RECORD.pack(len(frame), at, request_id, command_id, kind)
+                except Exception as e:
+                    # a bad record (e.g. of a malformed reply) must not stop the recording
+                    logger.error(
+                        f"failed to record a frame of request {request_id}: {e}"
+                    )
+                else:
+                    last = at
+                    if not block:
+                        first = last
+                    block += header
+                    block += frame
+                    commands |= _COMMAND_BITS.get(command_id, 0)
+                    self.records += 1
+            # a block ends when it is full, old enough, or the recording stops
+            if block and (
+                item is None
+                or item is _STOP
+                or len(block) >= self.block_bytes
+                or last - first >= self.block_seconds
+            ):
+                try:
+                    self._file.write(block)
+                    self._file.flush()
+                    # the index never points past the data
+                    self._index.write(
+                        _INDEX.pack(first, last, block_offset, len(block), commands)
+                    )
+                    self._index.flush()
+                except OSError as e:
+                    logger.error(f"failed to write traffic to {self.path}: {e}")
+                self.bytes_written += len(block)
+                block_offset += len(block)
+                block = bytearray()
+                commands = 0
+            if item is _STOP:
+                break
+
+    def close(self) -> None:
+        """Writes the records still queued and closes the files."""
+        if self._closed:
+            return
+        self._closed = True
+        atexit.unregister(self.close)
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._file.close()
+        self._index.close()
+
+    def __enter__(self) -> "TrafficRecorder":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+class TrafficRecord:
+    """A frame of a recording."""
+
+    __slots__ = ("time", "sent", "request_id", "command_id", "frame")
+
+    def __init__(
+        self,
+        time: float,
+        sent: bool,
+        request_id: int,
+        command_id: CommandType | None,
+        frame: str | bytes,
+    ) -> None:
+        self.time = time
+        self.sent = sent
+        self.request_id = request_id
+        self.command_id = command_id
+        self.frame = frame
+
+    def value(self) -> Any:
+        """The decoded frame, e.g. `[request_id, status, value]` for a reply."""
+        if isinstance(self.frame, str):
+            return self.frame
+        return bytes_to_var(self.frame)
+
+    def __repr__(self) -> str:
+        direction = "sent" if self.sent else "received"
+        command = self.command_id.name if self.command_id is not None else "?"
+        return f"TrafficRecord({self.time:.6f}, {direction}, {command}, request {self.request_id}, {len(self.frame)} B)"
+
+
+class TrafficLog:
+    """
+    Reads a recording of `TrafficRecorder`.
+
+    `records()` yields the frames in order, optionally only those between
+    `start` and `end` seconds into the recording and of some commands;
+    with the index, only the blocks that can hold such frames are read.
+    A recording cut short (e.g. by a crash) is read up to its last whole
+    record.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as file:
+            if file.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError(f"{path} is not a traffic recording")
+            self.wall_time, self.monotonic_time = _HEADER.unpack(
+                file.read(_HEADER.size)
+            )
+        self.data_offset = len(_MAGIC) + _HEADER.size
+        self.blocks = self.__read_index()
+
+    def __read_index(self) -> list[tuple[float, float, int, int, int]]:
+        blocks: list[tuple[float, float, int, int, int]] = []
+        try:
+            with open(self.path + ".idx", "rb") as file:
+                if file.read(len(_INDEX_MAGIC)) != _INDEX_MAGIC:
+                    return blocks
+                data = file.read()
+        except FileNotFoundError:
+            return blocks
+        whole = len(data) - len(data) % _INDEX.size
+        blocks.extend(_INDEX.iter_unpack(data[:whole]))
+        return blocks
+
+    def __iter__(self) -> Iterator[TrafficRecord]:
+        return self.records()
+
+    def records(
+        self,
+        start: float | None = None,
+        end: float | None = None,
+        commands: Iterable[CommandType] | None = None,
+    ) -> Iterator[TrafficRecord]:
+        wanted = None if commands is None else {int(c) for c in commands}
+        mask = _ALL_COMMANDS
+        if wanted is not None:
+            mask = 0
+            for command_id in wanted:
+                mask |= _COMMAND_BITS.get(CommandType(command_id), 0)
+        with open(self.path, "rb") as file:
+            indexed_end = self.data_offset
+            for first, last, offset, length, commands_in_block in self.blocks:
+                indexed_end = offset + length
+                if start is not None and last < start:
+                    continue
+                if end is not None and first > end:
+                    # blocks are in time order, the rest are later still
+                    return
+                if not commands_in_block & mask:
+                    continue
+                file.seek(offset)
+                yield from self.__parse(file.read(length), start, end, wanted)
+            # records after the last indexed block, if the recording was cut short
+            file.seek(indexed_end)
+            yield from self.__parse(file.read(), start, end, wanted)
+
+    def __parse(
+        self,
+        data: bytes,
+        start: float | None,
+        end: float | None,
+        wanted: set[int] | None,
+    ) -> Iterator[TrafficRecord]:
+        idx = 0
+        size = _RECORD.size
+        while idx + size <= len(data):
+            length, at, request_id, command_id, kind = _RECORD.unpack_from(data, idx)
+            idx += size
+            if idx + length > len(data):
+                return
+            frame: str | bytes = data[idx : idx + length]
+            idx += length
+            if start is not None and at < start:
+                continue
+            if end is not None and at > end:
+                return
+            if wanted is not None and command_id not in wanted:
+                continue
+            if kind & _TEXT:
+                frame = frame.decode(errors="replace")
+            yield TrafficRecord(
+                at,
+                kind & ~_TEXT == SENT,
+                request_id,
+                CommandType(command_id) if command_id in _COMMAND_IDS else None,
+                frame,
+            )
+
+
+_COMMAND_IDS = frozenset(int(command_id) for command_id in CommandType)
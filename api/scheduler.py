@@ -0,0 +1,250 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from typing import Any, Awaitable, Callable, Hashable
+
+from .constants import CommandPriority, CommandType, StatusCode, WRITE_COMMANDS
+from .frame_templates import _template_key
+from .structures import ApiException
+
+_ACTION_COMMANDS = frozenset(
+    {
+        CommandType.PLACE_TOWER,
+        CommandType.SELL_TOWER,
+        CommandType.SET_STRATEGY,
+        CommandType.SPAWN_UNIT,
+        CommandType.CAST_SPELL,
+    }
+)
+_COSMETIC_COMMANDS = frozenset(
+    {
+        CommandType.SEND_CHAT,
+        CommandType.GET_CHAT_HISTORY,
+        CommandType.SET_CHAT_NAME_COLOR,
+        CommandType.PIXELCAT,
+        CommandType.GET_DEVS,
+        CommandType.SET_NAME,
+    }
+)
+
+
+def default_priority(command_id: CommandType) -> CommandPriority:
+    if command_id in _ACTION_COMMANDS:
+        return CommandPriority.ACTION
+    if command_id in _COSMETIC_COMMANDS:
+        return CommandPriority.COSMETIC
+    return CommandPriority.READ
+
+
+class _QueuedSend:
+    __slots__ = (
+        "command_id",
+        "args",
+        "decode_reply",
+        "deadline",
+        "key",
+        "sent",
+        "timer",
+    )
+
+    def __init__(
+        self,
+        command_id: CommandType,
+        args: list[Any],
+        decode_reply: Any,
+        deadline: float | None,
+        key: Hashable | None,
+        sent: asyncio.Future,
+    ) -> None:
+        self.command_id = command_id
+        self.args = args
+        self.decode_reply = decode_reply
+        self.deadline = deadline
+        self.key = key
+        # resolves to the request id and the future of the reply once sent
+        self.sent = sent
+        # fails the send at its deadline if it is still queued
+        self.timer: asyncio.TimerHandle | None = None
+
+
+class CommandScheduler:
+    """
+    Orders the sends of a client by priority instead of arrival.
+
+    Sends are queued by `CommandPriority`, then by deadline, then in order
+    of arrival. A single dispatch task waits for the rate limiter first and
+    only then picks the next send, so an action queued during the wait
+    still goes out before reads queued earlier. A send still queued at its
+    deadline (in `time.monotonic()` seconds) fails with `CLIENT_ERR` right
+    then, even while sends of a higher priority keep going out.
+
+    With `merge_reads`, a read queued while the same read (command and
+    arguments) is still waiting in the queue is merged into it: both
+    callers share one request, owned by the caller that queued it first.
+    """
+
+    def __init__(
+        self,
+        acquire: Callable[[], Awaitable[None]],
+        send: Callable[..., Awaitable[tuple[int, asyncio.Future]]],
+        on_wait: Callable[[CommandType, float], None] | None = None,
+        merge_reads: bool = True,
+    ) -> None:
+        self._acquire = acquire
+        self._send = send
+        self.merge_reads = merge_reads
+        # told how long each send waited for the rate limiter
+        self._on_wait = on_wait
+        self._queue: list[tuple[int, float, int, _QueuedSend]] = []
+        self._queued_reads: dict[Hashable, _QueuedSend] = {}
+        self._counter = itertools.count()
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self.sent = 0
+        self.merged = 0
+        self.expired = 0
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    async def submit(
+        self,
+        command_id: CommandType,
+        args: list[Any],
+        decode_reply: Any,
+        priority: CommandPriority,
+        deadline: float | None = None,
+    ) -> tuple[int, asyncio.Future, bool]:
+        """
+        Queues a send. Once sent, returns the request id, the future of its
+        reply and whether this caller owns the request (False when merged).
+        """
+        key = None
+        if self.merge_reads and command_id not in WRITE_COMMANDS:
+            key = _template_key(command_id, args)
+            queued = self._queued_reads.get(key) if key is not None else None
+            if queued is not None and queued.decode_reply is decode_reply:
+                self.merged += 1
+                # the send is shared, a cancelled caller must not cancel it
+                request_id, reply = await asyncio.shield(queued.sent)
+                return request_id, reply, False
+
+        loop = asyncio.get_running_loop()
+        queued = _QueuedSend(
+            command_id, args, decode_reply, deadline, key, loop.create_future()
+        )
+        if key is not None:
+            self._queued_reads[key] = queued
+        heapq.heappush(
+            self._queue,
+            (
+                priority,
+                math.inf if deadline is None else deadline,
+                next(self._counter),
+                queued,
+            ),
+        )
+        if deadline is not None:
+            queued.timer = loop.call_later(
+                max(0.0, deadline - time.monotonic()), self.__expire, queued
+            )
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self.__dispatch())
+        assert self._wakeup is not None
+        self._wakeup.set()
+        request_id, reply = await asyncio.shield(queued.sent)
+        return request_id, reply, True
+
+    def __forget_read(self, queued: _QueuedSend) -> None:
+        if queued.key is not None and self._queued_reads.get(queued.key) is queued:
+            del self._queued_reads[queued.key]
+
+    def __fail_expired(self, queued: _QueuedSend) -> None:
+        self.expired += 1
+        queued.sent.set_exception(
+            ApiException(
+                queued.command_id,
+                StatusCode.CLIENT_ERR,
+                f"{queued.command_id.name} was not sent before its deadline",
+            )
+        )
+
+    def __expire(self, queued: _QueuedSend) -> None:
+        """Fails a send still queued at its deadline."""
+        for i, entry in enumerate(self._queue):
+            if entry[3] is queued:
+                self._queue[i] = self._queue[-1]
+                self._queue.pop()
+                heapq.heapify(self._queue)
+                break
+        else:
+            # already taken by the dispatch task
+            return
+        self.__forget_read(queued)
+        self.__fail_expired(queued)
+
+    def __pop_next(self) -> _QueuedSend | None:
+        """Removes the next send to go out, failing the expired ones on the way."""
+        now = time.monotonic()
+        while self._queue:
+            _, deadline, _, queued = heapq.heappop(self._queue)
+            if queued.timer is not None:
+                queued.timer.cancel()
+            self.__forget_read(queued)
+            if deadline < now:
+                self.__fail_expired(queued)
+                continue
+            return queued
+        return None
+
+    async def __dispatch(self) -> None:
+        assert self._wakeup is not None
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            started = time.perf_counter()
+            await self._acquire()
+            waited = time.perf_counter() - started
+            queued = self.__pop_next()
+            if queued is None:
+                continue
+            if self._on_wait is not None:
+                self._on_wait(queued.command_id, waited)
+            try:
+                queued.sent.set_result(
+                    await self._send(
+                        queued.command_id,
+                        queued.args,
+                        queued.decode_reply,
+                        queued.deadline,
+                    )
+                )
+                self.sent += 1
+            except Exception as e:
+                queued.sent.set_exception(e)
+
+    def close(self) -> None:
+        """Stops the dispatch task, the sends still queued fail."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for *_, queued in self._queue:
+            if queued.timer is not None:
+                queued.timer.cancel()
+            if not queued.sent.done():
+                queued.sent.set_exception(ConnectionError("the client was closed"))
+        self._queue.clear()
+        self._queued_reads.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "queued": len(self._queue),
+            "sent": self.sent,
+            "merged": self.merged,
+            "expired": self.expired,
+        }
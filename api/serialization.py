@@ -1,8 +1,14 @@
-from typing import Any
+from typing import Any, Callable, Iterable, Iterator, get_args, get_origin
+from array import array
+from collections.abc import Sequence
 from enum import IntEnum
+import functools
+import math
 import struct
+import sys
 
-from .structures import Vector2
+from .constants import StatusCode, TowerType, EnemyType, TerrainType
+from .structures import Vector2, Tower, Enemy, TerrainGrid, PackedVector2Array
 
 
 class TypeCode(IntEnum):
@@ -14,6 +20,12 @@ class TypeCode(IntEnum):
     VECTOR2I_TYPE = 6
     DICTIONARY_TYPE = 27
     LIST_TYPE = 28
+    PACKED_BYTE_ARRAY_TYPE = 29
+    PACKED_INT32_ARRAY_TYPE = 30
+    PACKED_INT64_ARRAY_TYPE = 31
+    PACKED_FLOAT32_ARRAY_TYPE = 32
+    PACKED_FLOAT64_ARRAY_TYPE = 33
+    PACKED_VECTOR2_ARRAY_TYPE = 35
 
 
 # Byte 0: `Variant::Type`, byte 1: unused, bytes 2 and 3: additional data.
@@ -39,226 +51,1098 @@ class ContainerTypeKind(IntEnum):
     SCRIPT = 0b11
 
 
-def var_to_bytes(obj: Any) -> bytes:
-    serialized = bytearray()
-
-    def pushInt32(x: int) -> None:
-        nonlocal serialized
-        x = x if x >= 0 else (x + 2**31)
-        for _ in range(4):
-            serialized.append(x & 255)
-            x //= 256
-
-    def pushFloat32(x: float) -> None:
-        nonlocal serialized
-        packed_bytes = struct.pack(">f", x)
-        ieee_integer = struct.unpack(">I", packed_bytes)[0]
-        pushInt32(ieee_integer)
-
-    def pushFloat64(x: float) -> None:
-        nonlocal serialized
-        packed_bytes = struct.pack(">d", x)
-        ieee_integer = struct.unpack(">Q", packed_bytes)[0]
-        pushInt32(ieee_integer % (2**32))
-        pushInt32(ieee_integer // (2**32))
-
-    def pushString(value: str) -> None:
-        nonlocal serialized
-        encoded = bytearray(value.encode("utf-8"))
-        length = len(encoded)
-        while length % 4 != 0:
-            encoded.append(0)
-            length += 1
-        pushInt32(length)
-        serialized += encoded
+_UINT32 = struct.Struct("<I")
+_INT32 = struct.Struct("<i")
+_INT64 = struct.Struct("<q")
+_FLOAT32 = struct.Struct("<f")
+_FLOAT64 = struct.Struct("<d")
+_VECTOR2I = struct.Struct("<ii")
 
-    if obj is None:
-        pushInt32(0)
+_HEADER_INT32 = struct.Struct("<Ii")
+_HEADER_INT64 = struct.Struct("<Iq")
+_HEADER_FLOAT32 = struct.Struct("<If")
+_HEADER_FLOAT64 = struct.Struct("<Id")
+_HEADER_VECTOR2I = struct.Struct("<Iii")
+_HEADER_LENGTH = struct.Struct("<II")
+
+_FLOAT32_MAX = 3.4028234663852886e38
+
+
+def _fits_float32(x: float) -> bool:
+    if math.isinf(x):
+        return True
+    if not abs(x) <= _FLOAT32_MAX:  # also rejects nan
+        return False
+    return _FLOAT32.unpack(_FLOAT32.pack(x))[0] == x
+
+
+# Packed arrays are exchanged with Python as `array.array` of the matching type code,
+# `bytes`/`bytearray` and `PackedVector2Array`. Their elements are little-endian on the wire.
+_BIG_ENDIAN_HOST = sys.byteorder == "big"
+_PACKED_ARRAY_TYPES = {
+    "i": TypeCode.PACKED_INT32_ARRAY_TYPE,
+    "q": TypeCode.PACKED_INT64_ARRAY_TYPE,
+    "f": TypeCode.PACKED_FLOAT32_ARRAY_TYPE,
+    "d": TypeCode.PACKED_FLOAT64_ARRAY_TYPE,
+}
+
+
+def _packed_vector2_header(obj: array) -> int:
+    if len(obj) % 2:
+        raise ValueError(
+            f"[GdType] Unable to serialize PackedVector2Array of {len(obj)} coordinates, expected x, y pairs"
+        )
+    if obj.typecode in ("f", "d"):
+        return TypeCode.PACKED_VECTOR2_ARRAY_TYPE | (
+            HEADER_DATA_FLAG_64 if obj.typecode == "d" else 0
+        )
+    raise ValueError(
+        f"[GdType] Unable to serialize PackedVector2Array of type code '{obj.typecode}'"
+    )
 
+
+def _little_endian_bytes(obj: array) -> memoryview | bytes:
+    if _BIG_ENDIAN_HOST:
+        swapped = array(obj.typecode, obj)
+        swapped.byteswap()
+        return swapped.tobytes()
+    return memoryview(obj).cast("B")
+
+
+def _unsupported_type(obj: Any) -> ValueError:
+    return ValueError(f"[GdType] Unable to serialize variables of type '{type(obj)}'")
+
+
+# First pass: the exact number of bytes `obj` takes on the wire.
+# Encoded strings are queued in `strings` so the second pass does not encode them again.
+def _encoded_size(obj: Any, strings: list[bytes]) -> int:
+    if obj is None:
+        return 4
     elif isinstance(obj, bool):
-        pushInt32(TypeCode.BOOL_TYPE)
-        pushInt32(int(obj))
+        return 8
+    elif isinstance(obj, int):
+        if -(2**31) <= obj < 2**31:
+            return 8
+        if -(2**63) <= obj < 2**63:
+            return 12
+        raise ValueError(f"[GdType] Unable to serialize {obj}: out of 64-bit range")
+    elif isinstance(obj, float):
+        return 8 if _fits_float32(obj) else 12
+    elif isinstance(obj, str):
+        encoded = obj.encode("utf-8")
+        strings.append(encoded)
+        return 8 + len(encoded) + (-len(encoded) & 3)
+    elif isinstance(obj, Vector2):
+        return 12
+    elif isinstance(obj, (bytes, bytearray)):
+        return 8 + len(obj) + (-len(obj) & 3)
+    elif isinstance(obj, array):
+        if obj.typecode not in _PACKED_ARRAY_TYPES or obj.itemsize not in (4, 8):
+            raise ValueError(
+                f"[GdType] Unable to serialize array of type code '{obj.typecode}'"
+            )
+        return 8 + len(obj) * obj.itemsize
+    elif isinstance(obj, PackedVector2Array):
+        _packed_vector2_header(obj.coords)
+        return 8 + len(obj.coords) * obj.coords.itemsize
+    elif isinstance(obj, list):
+        size = 8
+        for item in obj:
+            size += _encoded_size(item, strings)
+        return size
+    elif isinstance(obj, dict):
+        size = 8
+        for key, value in obj.items():
+            size += _encoded_size(key, strings) + _encoded_size(value, strings)
+        return size
+    raise _unsupported_type(obj)
+
 
+# Second pass: writes `obj` at `offset` and returns the offset right after it.
+def _encode_into(
+    buf: bytearray, offset: int, obj: Any, strings: Iterator[bytes]
+) -> int:
+    if obj is None:
+        _UINT32.pack_into(buf, offset, TypeCode.NULL_TYPE)
+        return offset + 4
+    elif isinstance(obj, bool):
+        _HEADER_INT32.pack_into(buf, offset, TypeCode.BOOL_TYPE, int(obj))
+        return offset + 8
     elif isinstance(obj, int):
         if -(2**31) <= obj < 2**31:
-            pushInt32(TypeCode.INT_TYPE)
-            obj = obj if obj >= 0 else (obj + 2**31)
-            pushInt32(obj)
+            _HEADER_INT32.pack_into(buf, offset, TypeCode.INT_TYPE, obj)
+            return offset + 8
+        _HEADER_INT64.pack_into(
+            buf, offset, TypeCode.INT_TYPE | HEADER_DATA_FLAG_64, obj
+        )
+        return offset + 12
+    elif isinstance(obj, float):
+        if _fits_float32(obj):
+            _HEADER_FLOAT32.pack_into(buf, offset, TypeCode.FLOAT_TYPE, obj)
+            return offset + 8
+        _HEADER_FLOAT64.pack_into(
+            buf, offset, TypeCode.FLOAT_TYPE | HEADER_DATA_FLAG_64, obj
+        )
+        return offset + 12
+    elif isinstance(obj, str):
+        encoded = next(strings)
+        length = len(encoded)
+        _HEADER_LENGTH.pack_into(buf, offset, TypeCode.STRING_TYPE, length)
+        offset += 8
+        buf[offset : offset + length] = encoded
+        # the padding is already zero in the preallocated buffer
+        return offset + length + (-length & 3)
+    elif isinstance(obj, Vector2):
+        _HEADER_VECTOR2I.pack_into(buf, offset, TypeCode.VECTOR2I_TYPE, obj.x, obj.y)
+        return offset + 12
+    elif isinstance(obj, (bytes, bytearray)):
+        length = len(obj)
+        _HEADER_LENGTH.pack_into(buf, offset, TypeCode.PACKED_BYTE_ARRAY_TYPE, length)
+        offset += 8
+        buf[offset : offset + length] = obj
+        return offset + length + (-length & 3)
+    elif isinstance(obj, (array, PackedVector2Array)):
+        if isinstance(obj, array):
+            header, values, count = _PACKED_ARRAY_TYPES[obj.typecode], obj, len(obj)
         else:
-            pushInt32(TypeCode.INT_TYPE + HEADER_DATA_FLAG_64)
-            obj = obj if obj >= 0 else (obj + 2**63)
-            pushInt32(obj % (2**32))
-            pushInt32(obj // (2**32))
+            header, values = _packed_vector2_header(obj.coords), obj.coords
+            count = len(values) // 2
+        _HEADER_LENGTH.pack_into(buf, offset, header, count)
+        offset += 8
+        size = len(values) * values.itemsize
+        buf[offset : offset + size] = _little_endian_bytes(values)
+        return offset + size
+    elif isinstance(obj, list):
+        _HEADER_LENGTH.pack_into(buf, offset, TypeCode.LIST_TYPE, len(obj))
+        offset += 8
+        for item in obj:
+            offset = _encode_into(buf, offset, item, strings)
+        return offset
+    else:  # a dict, anything else was rejected by _encoded_size
+        _HEADER_LENGTH.pack_into(buf, offset, TypeCode.DICTIONARY_TYPE, len(obj))
+        offset += 8
+        for key, value in obj.items():
+            offset = _encode_into(buf, offset, key, strings)
+            offset = _encode_into(buf, offset, value, strings)
+        return offset
 
-    elif isinstance(obj, float):
-        try:
-            packed_bytes = struct.pack(">f", obj)
-            obj_as_f32 = struct.unpack(">f", packed_bytes)[0]
-            if obj_as_f32 == obj:
-                pushInt32(TypeCode.FLOAT_TYPE)
-                pushFloat32(obj)
-            else:
-                raise Exception("Value cannot be represented as float32")
-        except Exception:
-            pushInt32(TypeCode.FLOAT_TYPE + HEADER_DATA_FLAG_64)
-            pushFloat64(obj)
 
-    elif isinstance(obj, str):
-        pushInt32(TypeCode.STRING_TYPE)
-        pushString(obj)
+def var_to_bytes(obj: Any) -> bytes:
+    """
+    Encodes `obj` as one Godot variant.
 
-    elif isinstance(obj, Vector2):
-        pushInt32(TypeCode.VECTOR2I_TYPE)
-        pushInt32(obj.x)
-        pushInt32(obj.y)
+    The exact output size is computed first, then everything is written into a
+    single preallocated buffer with `struct.pack_into`.
+    """
+    strings: list[bytes] = []
+    buf = bytearray(_encoded_size(obj, strings))
+    _encode_into(buf, 0, obj, iter(strings))
+    return bytes(buf)
 
-    elif isinstance(obj, list):
-        pushInt32(TypeCode.LIST_TYPE)
-        pushInt32(len(obj))
-        for i in obj:
-            serialized += var_to_bytes(i)
 
+_unpack_uint32 = _UINT32.unpack_from
+_unpack_int32 = _INT32.unpack_from
+_unpack_int64 = _INT64.unpack_from
+_unpack_float32 = _FLOAT32.unpack_from
+_unpack_float64 = _FLOAT64.unpack_from
+_unpack_vector2i = _VECTOR2I.unpack_from
+_unpack_header_length = _HEADER_LENGTH.unpack_from
+
+
+def _insufficient_data() -> ValueError:
+    return ValueError("[GdType] Unable to deserialize: insufficient data in sequence")
+
+
+def _check_count(view: memoryview, idx: int, count: int) -> None:
+    """Rejects a list of `count` elements at `idx` that cannot fit in the rest of the input."""
+    # every element takes at least its 4-byte header
+    if 4 * count > len(view) - idx:
+        raise _insufficient_data()
+
+
+# the contained type of typed arrays/dictionaries, but we don't need this in python
+def _skip_container_type(type_kind: int, view: memoryview, idx: int) -> int:
+    if type_kind == ContainerTypeKind.NONE:
+        return idx
+    if type_kind == ContainerTypeKind.BUILTIN:
+        _unpack_uint32(view, idx)
+        return idx + 4
+    raise ValueError(
+        f"[GdType] Unable to deserialize: unsupported container type {ContainerTypeKind(type_kind)} at {idx - 4}"
+    )
+
+
+# Bounded caches shared by every decode. Replies repeat the same dictionary
+# keys ("position", "health", ...) and short values ("none", ...) over and
+# over, so short strings are decoded once and then looked up by their raw
+# bytes. Decoded Vector2i values can optionally be shared as well, but
+# Vector2 is mutable, so that is off unless asked for.
+_string_cache: dict[bytes, str] = {}
+_vector_cache: dict[tuple[int, int], Vector2] = {}
+_cache_max_string_length = 32
+_cache_capacity = 4096
+_cache_share_vectors = False
+# string hits, string misses, vector hits, vector misses
+_cache_counters = [0, 0, 0, 0]
+
+
+def configure_decoder_cache(
+    max_string_length: int = 32, capacity: int = 4096, share_vectors: bool = False
+) -> None:
+    """
+    Configures and clears the decoder caches.
+
+    Strings of at most `max_string_length` UTF-8 bytes are interned, up to
+    `capacity` distinct strings; 0 disables interning. With `share_vectors`,
+    equal Vector2i values decode to the same `Vector2` instance, up to
+    `capacity` distinct vectors, so they must not be mutated.
+    """
+    global _cache_max_string_length, _cache_capacity, _cache_share_vectors
+    _cache_max_string_length = max_string_length
+    _cache_capacity = capacity
+    _cache_share_vectors = share_vectors
+    _string_cache.clear()
+    _vector_cache.clear()
+    _cache_counters[:] = [0, 0, 0, 0]
+
+
+def decoder_cache_stats() -> dict[str, float]:
+    """Returns hit/miss counters, hit rates and sizes of the decoder caches."""
+    string_hits, string_misses, vector_hits, vector_misses = _cache_counters
+    return {
+        "string_hits": string_hits,
+        "string_misses": string_misses,
+        "string_hit_rate": string_hits / max(string_hits + string_misses, 1),
+        "strings_cached": len(_string_cache),
+        "vector_hits": vector_hits,
+        "vector_misses": vector_misses,
+        "vector_hit_rate": vector_hits / max(vector_hits + vector_misses, 1),
+        "vectors_cached": len(_vector_cache),
+    }
+
+
+def _decode_string(view: memoryview, idx: int) -> tuple[str, int]:
+    length = _unpack_uint32(view, idx)[0]
+    idx += 4
+    end = idx + length
+    if end > len(view):
+        raise _insufficient_data()
+    if length > _cache_max_string_length:
+        return str(view[idx:end], "utf-8"), end + (-length & 3)
+    raw = view[idx:end]
+    value = _string_cache.get(raw)
+    if value is not None:
+        _cache_counters[0] += 1
+    else:
+        _cache_counters[1] += 1
+        value = str(raw, "utf-8")
+        # only cached strings are interned: interned strings are never freed
+        if len(_string_cache) < _cache_capacity:
+            value = sys.intern(value)
+            _string_cache[bytes(raw)] = value
+    return value, end + (-length & 3)
+
+
+def _make_vector2(x: int, y: int) -> Vector2:
+    if not _cache_share_vectors:
+        return Vector2(x, y)
+    key = (x, y)
+    vector = _vector_cache.get(key)
+    if vector is not None:
+        _cache_counters[2] += 1
     else:
+        _cache_counters[3] += 1
+        vector = Vector2(x, y)
+        if len(_vector_cache) < _cache_capacity:
+            _vector_cache[key] = vector
+    return vector
+
+
+# Every `_decode_*` function below receives the view, the offset right after
+# the header and the header itself, and returns the value with the next offset.
+
+
+def _decode_null(view: memoryview, idx: int, header: int) -> tuple[Any, int]:
+    return None, idx
+
+
+def _decode_bool(view: memoryview, idx: int, header: int) -> tuple[Any, int]:
+    return _unpack_uint32(view, idx)[0] == 1, idx + 4
+
+
+def _decode_int(view: memoryview, idx: int, header: int) -> tuple[Any, int]:
+    if header & HEADER_DATA_FLAG_64:
+        return _unpack_int64(view, idx)[0], idx + 8
+    return _unpack_int32(view, idx)[0], idx + 4
+
+
+def _decode_float(view: memoryview, idx: int, header: int) -> tuple[Any, int]:
+    if header & HEADER_DATA_FLAG_64:
+        return _unpack_float64(view, idx)[0], idx + 8
+    return _unpack_float32(view, idx)[0], idx + 4
+
+
+def _decode_str(view: memoryview, idx: int, header: int) -> tuple[Any, int]:
+    return _decode_string(view, idx)
+
+
+def _decode_vector2i(view: memoryview, idx: int, header: int) -> tuple[Any, int]:
+    x, y = _unpack_vector2i(view, idx)
+    return _make_vector2(x, y), idx + 8
+
+
+def _decode_dictionary(view: memoryview, idx: int, header: int) -> tuple[Any, int]:
+    idx = _skip_container_type(
+        (header & HEADER_DATA_FIELD_TYPED_DICTIONARY_KEY_MASK)
+        >> HEADER_DATA_FIELD_TYPED_DICTIONARY_KEY_SHIFT,
+        view,
+        idx,
+    )
+    idx = _skip_container_type(
+        (header & HEADER_DATA_FIELD_TYPED_DICTIONARY_VALUE_MASK)
+        >> HEADER_DATA_FIELD_TYPED_DICTIONARY_VALUE_SHIFT,
+        view,
+        idx,
+    )
+    count = _unpack_uint32(view, idx)[0] & 0x7FFFFFFF
+    idx += 4
+    result = {}
+    for _ in range(count):
+        key, idx = _decode_value(view, idx)
+        result[key], idx = _decode_value(view, idx)
+    return result, idx
+
+
+def _decode_list(view: memoryview, idx: int, header: int) -> tuple[Any, int]:
+    idx = _skip_container_type(
+        (header & HEADER_DATA_FIELD_TYPED_ARRAY_MASK)
+        >> HEADER_DATA_FIELD_TYPED_ARRAY_SHIFT,
+        view,
+        idx,
+    )
+    length = _unpack_uint32(view, idx)[0] & 0x7FFFFFFF
+    idx += 4
+    _check_count(view, idx, length)
+    result = [None] * length
+    for i in range(length):
+        result[i], idx = _decode_value(view, idx)
+    return result, idx
+
+
+def _decode_packed_byte_array(
+    view: memoryview, idx: int, header: int
+) -> tuple[Any, int]:
+    length = _unpack_uint32(view, idx)[0]
+    idx += 4
+    end = idx + length
+    if end > len(view):
+        raise _insufficient_data()
+    return bytes(view[idx:end]), end + (-length & 3)
+
+
+def _read_packed(
+    view: memoryview, idx: int, typecode: str, count: int
+) -> tuple[array, int]:
+    # one copy of the whole block, no Python object per element
+    values = array(typecode)
+    end = idx + count * values.itemsize
+    if end > len(view):
+        raise _insufficient_data()
+    values.frombytes(view[idx:end])
+    if _BIG_ENDIAN_HOST:
+        values.byteswap()
+    return values, end
+
+
+def _packed_array_decoder(
+    typecode: str,
+) -> Callable[[memoryview, int, int], tuple[Any, int]]:
+    def decode(view: memoryview, idx: int, header: int) -> tuple[Any, int]:
+        count = _unpack_uint32(view, idx)[0]
+        return _read_packed(view, idx + 4, typecode, count)
+
+    return decode
+
+
+def _decode_packed_vector2_array(
+    view: memoryview, idx: int, header: int
+) -> tuple[Any, int]:
+    count = _unpack_uint32(view, idx)[0]
+    typecode = "d" if header & HEADER_DATA_FLAG_64 else "f"
+    coords, idx = _read_packed(view, idx + 4, typecode, 2 * count)
+    return PackedVector2Array(coords), idx
+
+
+_DECODERS: dict[int, Callable[[memoryview, int, int], tuple[Any, int]]] = {
+    TypeCode.NULL_TYPE: _decode_null,
+    TypeCode.BOOL_TYPE: _decode_bool,
+    TypeCode.INT_TYPE: _decode_int,
+    TypeCode.FLOAT_TYPE: _decode_float,
+    TypeCode.STRING_TYPE: _decode_str,
+    TypeCode.VECTOR2I_TYPE: _decode_vector2i,
+    TypeCode.DICTIONARY_TYPE: _decode_dictionary,
+    TypeCode.LIST_TYPE: _decode_list,
+    TypeCode.PACKED_BYTE_ARRAY_TYPE: _decode_packed_byte_array,
+    TypeCode.PACKED_INT32_ARRAY_TYPE: _packed_array_decoder("i"),
+    TypeCode.PACKED_INT64_ARRAY_TYPE: _packed_array_decoder("q"),
+    TypeCode.PACKED_FLOAT32_ARRAY_TYPE: _packed_array_decoder("f"),
+    TypeCode.PACKED_FLOAT64_ARRAY_TYPE: _packed_array_decoder("d"),
+    TypeCode.PACKED_VECTOR2_ARRAY_TYPE: _decode_packed_vector2_array,
+}
+
+
+_INT_TYPE = int(TypeCode.INT_TYPE)
+_STRING_TYPE = int(TypeCode.STRING_TYPE)
+
+
+def _decode_value(view: memoryview, idx: int) -> tuple[Any, int]:
+    header = _unpack_uint32(view, idx)[0]
+    idx += 4
+    # ints and strings make up most of every reply, decode them without a dispatch
+    if header == _INT_TYPE:
+        return _unpack_int32(view, idx)[0], idx + 4
+    if header == _STRING_TYPE:
+        return _decode_string(view, idx)
+    decoder = _DECODERS.get(header & HEADER_TYPE_MASK)
+    if decoder is None:
         raise ValueError(
-            f"[GdType] Unable to serialize variables of type '{type(obj)}'"
+            f"[GdType] Unable to deserialize: unsupported type code {header & HEADER_TYPE_MASK} at {idx - 4}"
         )
-
-    return bytes(serialized)
+    return decoder(view, idx, header)
 
 
-def bytes_to_var(serialized: bytes) -> Any:
+def _readonly_view(serialized: bytes | bytearray | memoryview) -> memoryview:
     if len(serialized) % 4 != 0 or len(serialized) < 4:
         raise ValueError(
             f"[GdType] Unable to deserialize: sequence length {len(serialized)} is not multiple of 4"
         )
-    idx = 0
+    view = memoryview(serialized)
+    # keys are looked up by hashing slices, which needs an immutable buffer
+    return view if view.readonly else memoryview(bytes(view))
+
+
+def bytes_to_var(serialized: bytes | bytearray | memoryview, lazy: bool = False) -> Any:
+    """
+    Decodes one Godot variant from `serialized`.
+
+    The buffer is walked in place through a `memoryview` with precompiled
+    `struct.Struct` readers, so `bytes` input is never copied. Mutable
+    buffers are copied once, because cached strings are looked up by slices.
+
+    With `lazy`, arrays are returned as `LazyList` views that decode each
+    element on first access; dictionaries are still decoded eagerly.
+    """
+    view = _readonly_view(serialized)
+    try:
+        value, _ = (_decode_value_lazy if lazy else _decode_value)(view, 0)
+    except struct.error:
+        raise _insufficient_data() from None
+    return value
+
+
+# ---------------------------------------------------------------------------
+# Schema-directed decoding: the declared return type of a command is compiled
+# into a decoder that builds the final objects straight from the wire bytes,
+# without intermediate dicts, lists or key strings.
+
+FieldDecoder = Callable[[memoryview, int], tuple[Any, int]]
+
+
+def _expect_header(view: memoryview, idx: int, typecode: TypeCode) -> int:
+    header = _unpack_uint32(view, idx)[0]
+    if header & HEADER_TYPE_MASK != typecode:
+        raise ValueError(
+            f"[GdType] Unable to deserialize: expected {typecode.name} at {idx}, got type code {header & HEADER_TYPE_MASK}"
+        )
+    return header
+
+
+def _open_dictionary(view: memoryview, idx: int) -> tuple[int, int]:
+    """Reads a dictionary header at `idx`, returns its size and the offset of the first key."""
+    header = _expect_header(view, idx, TypeCode.DICTIONARY_TYPE)
+    idx = _skip_container_type(
+        (header & HEADER_DATA_FIELD_TYPED_DICTIONARY_KEY_MASK)
+        >> HEADER_DATA_FIELD_TYPED_DICTIONARY_KEY_SHIFT,
+        view,
+        idx + 4,
+    )
+    idx = _skip_container_type(
+        (header & HEADER_DATA_FIELD_TYPED_DICTIONARY_VALUE_MASK)
+        >> HEADER_DATA_FIELD_TYPED_DICTIONARY_VALUE_SHIFT,
+        view,
+        idx,
+    )
+    return _unpack_uint32(view, idx)[0] & 0x7FFFFFFF, idx + 4
+
+
+def _open_list(view: memoryview, idx: int) -> tuple[int, int]:
+    """Reads an array header at `idx`, returns its length and the offset of the first element."""
+    header = _expect_header(view, idx, TypeCode.LIST_TYPE)
+    idx = _skip_container_type(
+        (header & HEADER_DATA_FIELD_TYPED_ARRAY_MASK)
+        >> HEADER_DATA_FIELD_TYPED_ARRAY_SHIFT,
+        view,
+        idx + 4,
+    )
+    length = _unpack_uint32(view, idx)[0] & 0x7FFFFFFF
+    _check_count(view, idx + 4, length)
+    return length, idx + 4
+
+
+def _decode_key(view: memoryview, idx: int) -> tuple[memoryview, int]:
+    """Returns a string key as a slice of the input, the caller compares it to known bytes."""
+    header, length = _unpack_header_length(view, idx)
+    if header != _STRING_TYPE:
+        raise ValueError(
+            f"[GdType] Unable to deserialize: expected a string key at {idx}, got type code {header & HEADER_TYPE_MASK}"
+        )
+    idx += 8
+    end = idx + length
+    if end > len(view):
+        raise _insufficient_data()
+    return view[idx:end], end + (-length & 3)
 
-    def popInt32() -> int:
-        nonlocal idx
-        if len(serialized) - idx < 4:
+
+def _enum_field(enum_cls: type[IntEnum]) -> FieldDecoder:
+    members = {member.value: member for member in enum_cls}
+
+    def decode(view: memoryview, idx: int) -> tuple[Any, int]:
+        value, idx = _decode_value(view, idx)
+        member = members.get(value)
+        if member is None:
             raise ValueError(
-                "[GdType] Unable to deserialize: insufficient data in sequence"
+                f"[GdType] Unable to deserialize: {value} is not a valid {enum_cls.__name__}"
             )
-        result = 0
-        for i in range(4):
-            result = result * 256 + serialized[idx + 3 - i]
-        idx += 4
-        return result
+        return member, idx
+
+    return decode
 
-    def popFloat32() -> float:
-        nonlocal idx
-        if len(serialized) - idx < 4:
+
+def _decode_position(view: memoryview, idx: int) -> tuple[Any, int]:
+    # the server sends positions as {"x": int, "y": int}, but accept a Vector2i as well
+    if _unpack_uint32(view, idx)[0] & HEADER_TYPE_MASK != TypeCode.DICTIONARY_TYPE:
+        value, idx = _decode_value(view, idx)
+        if not isinstance(value, Vector2):
             raise ValueError(
-                "[GdType] Unable to deserialize: insufficient data in sequence"
+                f"[GdType] Unable to deserialize: expected a position, got {type(value)}"
             )
-        ieee_integer = popInt32()
-        return struct.unpack(">f", struct.pack(">I", ieee_integer))[0]
+        return value, idx
+    count, idx = _open_dictionary(view, idx)
+    x = y = None
+    for _ in range(count):
+        key, idx = _decode_key(view, idx)
+        value, idx = _decode_value(view, idx)
+        if key == b"x":
+            x = value
+        elif key == b"y":
+            y = value
+    if x is None or y is None:
+        missing = [name for name, value in (("x", x), ("y", y)) if value is None]
+        raise ValueError(
+            f"[GdType] Unable to deserialize Vector2: missing fields {missing}"
+        )
+    return _make_vector2(x, y), idx
 
-    def popFloat64() -> float:
-        nonlocal idx
-        if len(serialized) - idx < 8:
+
+def _record_decoder(
+    cls: type, fields: dict[str, FieldDecoder], empty_is_none: bool
+) -> FieldDecoder:
+    # dictionary keys are the attribute names of `cls`
+    by_key = {name.encode("utf-8"): (name, decode) for name, decode in fields.items()}
+    by_key_get = by_key.get
+
+    def decode(view: memoryview, idx: int) -> tuple[Any, int]:
+        count, idx = _open_dictionary(view, idx)
+        if count == 0 and empty_is_none:
+            return None, idx
+        # fill the instance directly, like from_dict would through __init__
+        obj = cls.__new__(cls)
+        attrs = obj.__dict__
+        found = 0
+        for _ in range(count):
+            key, idx = _decode_key(view, idx)
+            field = by_key_get(key)
+            if field is None:
+                _, idx = _decode_value(view, idx)
+                continue
+            attrs[field[0]], idx = field[1](view, idx)
+            found += 1
+        if found != len(by_key):
+            missing = [name for name in fields if name not in attrs]
             raise ValueError(
-                "[GdType] Unable to deserialize: insufficient data in sequence"
+                f"[GdType] Unable to deserialize {cls.__name__}: missing fields {missing}"
             )
-        ieee_integer = 0
-        for i in range(8):
-            ieee_integer = ieee_integer * 256 + serialized[idx + 7 - i]
-        idx += 8
-        return struct.unpack(">d", struct.pack(">Q", ieee_integer))[0]
-
-    def popString() -> str:
-        nonlocal idx
-        length = popInt32()
-        if len(serialized) - idx < length:
+        return obj, idx
+
+    return decode
+
+
+def _list_decoder(decode_item: FieldDecoder) -> FieldDecoder:
+    def decode(view: memoryview, idx: int) -> tuple[Any, int]:
+        length, idx = _open_list(view, idx)
+        result = [None] * length
+        for i in range(length):
+            result[i], idx = decode_item(view, idx)
+        return result, idx
+
+    return decode
+
+
+_TERRAIN_VALUES = bytes(terrain.value for terrain in TerrainType)
+_row_structs: dict[int, struct.Struct] = {}
+
+
+def _unknown_terrain() -> ValueError:
+    return ValueError(
+        "[GdType] Unable to deserialize TerrainGrid: unknown terrain type"
+    )
+
+
+def _decode_terrain_grid(view: memoryview, idx: int) -> tuple[Any, int]:
+    rows, idx = _open_list(view, idx)
+    cols = 0
+    cells = bytearray()
+    for x in range(rows):
+        length, idx = _open_list(view, idx)
+        if x == 0:
+            cols = length
+        elif length != cols:
             raise ValueError(
-                "[GdType] Unable to deserialize: insufficient data in sequence"
+                f"[GdType] Unable to deserialize TerrainGrid: rows of length {cols} and {length}"
             )
-        value = serialized[idx : idx + length].decode("utf-8")
-        if length % 4 != 0:
-            length += 4 - length % 4
-        idx += length
-        return value
-
-    # the contained type of typed arrays/dictionaries, but we don't need this in python
-    def popContainerType(type_kind: ContainerTypeKind) -> None:
-        match type_kind:
-            case ContainerTypeKind.NONE:
-                pass
-            case ContainerTypeKind.BUILTIN:
-                popInt32()
-            case _:
-                raise ValueError(
-                    f"[GdType] Unable to deserialize: unsupported container type {type_kind} at {idx - 4}"
-                )
+        # a row of plain int32 cells is read with a single unpack
+        row_struct = _row_structs.get(length)
+        if row_struct is None:
+            row_struct = _row_structs[length] = struct.Struct(f"<{2 * length}I")
+        words = (
+            row_struct.unpack_from(view, idx)
+            if idx + row_struct.size <= len(view)
+            else ()
+        )
+        if words and words[0::2].count(_INT_TYPE) == length:
+            try:
+                cells += bytes(words[1::2])
+            except ValueError:
+                raise _unknown_terrain() from None
+            idx += row_struct.size
+            continue
+        for _ in range(length):
+            value, idx = _decode_value(view, idx)
+            if type(value) is not int or not 0 <= value < 256:
+                raise _unknown_terrain()
+            cells.append(value)
+    if cells.translate(None, _TERRAIN_VALUES):
+        raise _unknown_terrain()
+    return TerrainGrid(rows, cols, cells), idx
+
+
+# ---------------------------------------------------------------------------
+# Lazy decoding: arrays are indexed in one pass that only skips over their
+# elements, and each element is decoded the first time it is accessed.
+
+_PACKED_ITEM_SIZES = {
+    TypeCode.PACKED_INT32_ARRAY_TYPE: 4,
+    TypeCode.PACKED_INT64_ARRAY_TYPE: 8,
+    TypeCode.PACKED_FLOAT32_ARRAY_TYPE: 4,
+    TypeCode.PACKED_FLOAT64_ARRAY_TYPE: 8,
+}
+
 
-    def _bytes_to_var() -> Any:
-        nonlocal serialized, idx
-        header = popInt32()
+def _skip_value(view: memoryview, idx: int) -> int:
+    """Returns the offset right after the value at `idx` without decoding it."""
+    # iterative, containers only add their element count to the values left to skip
+    remaining = 1
+    while remaining:
+        remaining -= 1
+        header = _unpack_uint32(view, idx)[0]
+        idx += 4
+        if header == _INT_TYPE:
+            idx += 4
+            continue
+        if header == _STRING_TYPE:
+            length = _unpack_uint32(view, idx)[0]
+            idx += 4 + length + (-length & 3)
+            continue
         typecode = header & HEADER_TYPE_MASK
+        if typecode == TypeCode.INT_TYPE or typecode == TypeCode.FLOAT_TYPE:
+            idx += 8 if header & HEADER_DATA_FLAG_64 else 4
+        elif typecode == TypeCode.BOOL_TYPE:
+            idx += 4
+        elif typecode == TypeCode.DICTIONARY_TYPE:
+            count, idx = _open_dictionary(view, idx - 4)
+            remaining += 2 * count
+        elif typecode == TypeCode.LIST_TYPE:
+            length, idx = _open_list(view, idx - 4)
+            remaining += length
+        elif typecode == TypeCode.NULL_TYPE:
+            pass
+        elif typecode == TypeCode.VECTOR2I_TYPE:
+            idx += 8
+        elif (
+            typecode == TypeCode.STRING_TYPE
+            or typecode == TypeCode.PACKED_BYTE_ARRAY_TYPE
+        ):
+            length = _unpack_uint32(view, idx)[0]
+            idx += 4 + length + (-length & 3)
+        elif typecode in _PACKED_ITEM_SIZES:
+            idx += 4 + _unpack_uint32(view, idx)[0] * _PACKED_ITEM_SIZES[typecode]
+        elif typecode == TypeCode.PACKED_VECTOR2_ARRAY_TYPE:
+            item_size = 16 if header & HEADER_DATA_FLAG_64 else 8
+            idx += 4 + _unpack_uint32(view, idx)[0] * item_size
+        else:
+            raise ValueError(
+                f"[GdType] Unable to deserialize: unsupported type code {typecode} at {idx - 4}"
+            )
+    return idx
 
-        match typecode:
-            case TypeCode.NULL_TYPE:
-                return None
 
-            case TypeCode.BOOL_TYPE:
-                return popInt32() == 1
-
-            case TypeCode.INT_TYPE:
-                lo = popInt32()
-                if header & HEADER_DATA_FLAG_64 != 0:
-                    hi = popInt32()
-                    lo = hi * (2**32) + lo
-                    lo = lo if lo < (2**63) else (lo - 2**63)
-                else:
-                    lo = lo if lo < (2**31) else (lo - 2**31)
-                return lo
-
-            case TypeCode.FLOAT_TYPE:
-                if header & HEADER_DATA_FLAG_64 != 0:
-                    return popFloat64()
-                else:
-                    return popFloat32()
-
-            case TypeCode.STRING_TYPE:
-                return popString()
-
-            case TypeCode.VECTOR2I_TYPE:
-                x = popInt32()
-                y = popInt32()
-                return Vector2(x, y)
-
-            case TypeCode.DICTIONARY_TYPE:
-                key_type_kind = ContainerTypeKind(
-                    (header & HEADER_DATA_FIELD_TYPED_DICTIONARY_KEY_MASK)
-                    >> HEADER_DATA_FIELD_TYPED_DICTIONARY_KEY_SHIFT
-                )
-                value_type_kind = ContainerTypeKind(
-                    (header & HEADER_DATA_FIELD_TYPED_DICTIONARY_VALUE_MASK)
-                    >> HEADER_DATA_FIELD_TYPED_DICTIONARY_VALUE_SHIFT
-                )
-                popContainerType(key_type_kind)
-                popContainerType(value_type_kind)
-                count = popInt32() & 0x7FFFFFFF
-                result = {}
-                for _ in range(count):
-                    key = _bytes_to_var()
-                    value = _bytes_to_var()
-                    result[key] = value
-                return result
-
-            case TypeCode.LIST_TYPE:
-                type_kind = ContainerTypeKind(
-                    (header & HEADER_DATA_FIELD_TYPED_ARRAY_MASK)
-                    >> HEADER_DATA_FIELD_TYPED_ARRAY_SHIFT
-                )
-                popContainerType(type_kind)
-                length = popInt32() & 0x7FFFFFFF
-                result = [_bytes_to_var() for _ in range(length)]
-                return result
+_NOT_DECODED = object()
+
+
+class LazyList(Sequence):
+    """
+    A read-only view of an encoded array. The element offsets are indexed up
+    front, each element is decoded on first access and then cached.
+
+    The view keeps the whole encoded reply alive until it is dropped.
+    """
+
+    def __init__(
+        self, view: memoryview, offsets: array, decode_item: FieldDecoder
+    ) -> None:
+        self._view = view
+        self._offsets = offsets
+        self._decode_item = decode_item
+        self._items = [_NOT_DECODED] * len(offsets)
 
-            case _:
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __getitem__(self, i: int | slice) -> Any:
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        item = self._items[i]
+        if item is _NOT_DECODED:
+            try:
+                item, _ = self._decode_item(self._view, self._offsets[i])
+            except struct.error:
+                raise _insufficient_data() from None
+            self._items[i] = item
+        return item
+
+    def __deepcopy__(self, memo: dict) -> "LazyList":
+        # the copy decodes its own elements from the same (read-only) view
+        return LazyList(self._view, self._offsets, self._decode_item)
+
+    def decoded_count(self) -> int:
+        """How many elements have been decoded so far."""
+        return len(self._items) - self._items.count(_NOT_DECODED)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (list, LazyList)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"LazyList({len(self)} items, {self.decoded_count()} decoded)"
+
+
+def _lazy_list_decoder(decode_item: FieldDecoder) -> FieldDecoder:
+    def decode(view: memoryview, idx: int) -> tuple[Any, int]:
+        length, idx = _open_list(view, idx)
+        offsets = array("q", bytes(8 * length))
+        for i in range(length):
+            offsets[i] = idx
+            idx = _skip_value(view, idx)
+        if idx > len(view):
+            raise _insufficient_data()
+        return LazyList(view, offsets, decode_item), idx
+
+    return decode
+
+
+def _decode_value_lazy(view: memoryview, idx: int) -> tuple[Any, int]:
+    if _unpack_uint32(view, idx)[0] & HEADER_TYPE_MASK == TypeCode.LIST_TYPE:
+        return _decode_list_lazy(view, idx)
+    return _decode_value(view, idx)
+
+
+_decode_list_lazy = _lazy_list_decoder(_decode_value_lazy)
+
+
+_SCHEMAS: dict[Any, FieldDecoder] = {
+    Vector2: _decode_position,
+    TerrainGrid: _decode_terrain_grid,
+    Tower: _record_decoder(
+        Tower,
+        {
+            "type": _enum_field(TowerType),
+            "position": _decode_position,
+            "level_a": _decode_value,
+            "level_b": _decode_value,
+            "aim": _decode_value,
+            "anti_air": _decode_value,
+            "reload": _decode_value,
+            "range": _decode_value,
+            "damage": _decode_value,
+            "bullet_effect": _decode_value,
+        },
+        empty_is_none=True,
+    ),
+    Enemy: _record_decoder(
+        Enemy,
+        {
+            "type": _enum_field(EnemyType),
+            "position": _decode_position,
+            "progress_ratio": _decode_value,
+            "income_impact": _decode_value,
+            "health": _decode_value,
+            "max_health": _decode_value,
+            "damage": _decode_value,
+            "max_speed": _decode_value,
+            "flying": _decode_value,
+            "knockback_resist": _decode_value,
+            "kill_reward": _decode_value,
+        },
+        empty_is_none=False,
+    ),
+}
+
+
+def _compile_schema(ret_type: Any, lazy: bool) -> FieldDecoder | None:
+    if ret_type in _SCHEMAS:
+        return _SCHEMAS[ret_type]
+    if get_origin(ret_type) is list:
+        # only the outermost list is lazy, nested ones are decoded with their element
+        decode_item = _compile_schema(get_args(ret_type)[0], False)
+        if decode_item is not None:
+            return (_lazy_list_decoder if lazy else _list_decoder)(decode_item)
+    return None
+
+
+@functools.cache
+def schema_reply_decoder(
+    ret_type: Any, lazy: bool = False
+) -> Callable[[bytes], tuple[list, bool]] | None:
+    """
+    Returns a decoder for replies `[request_id, status, value]` of a command
+    declared to return `ret_type`, or None when `ret_type` has no schema.
+
+    The decoder returns the reply and whether `value` was already built as
+    `ret_type`. Error replies and unexpected shapes are decoded generically.
+    With `lazy`, a list `value` is returned as a `LazyList`.
+    """
+    decode_value = _compile_schema(ret_type, lazy)
+    if decode_value is None:
+        return None
+
+    def decode_reply(serialized: bytes) -> tuple[list, bool]:
+        view = _readonly_view(serialized)
+        try:
+            header = _unpack_uint32(view, 0)[0]
+            if header & HEADER_TYPE_MASK == TypeCode.LIST_TYPE:
+                length, idx = _open_list(view, 0)
+                if length == 3:
+                    request_id, idx = _decode_value(view, idx)
+                    status, idx = _decode_value(view, idx)
+                    if status == StatusCode.OK:
+                        value, _ = decode_value(view, idx)
+                        return [request_id, status, value], True
+            return _decode_value(view, 0)[0], False
+        except struct.error:
+            raise _insufficient_data() from None
+
+    return decode_reply
+
+
+def peek_request_id(serialized: bytes) -> int | None:
+    """
+    Returns the request id of a reply `[request_id, status, ...]` without
+    decoding the rest of it, or None when the reply does not start that way.
+    """
+    view = memoryview(serialized)
+    try:
+        length, idx = _open_list(view, 0)
+        if length > 0:
+            header = _unpack_uint32(view, idx)[0]
+            if header == _INT_TYPE:
+                return _unpack_int32(view, idx + 4)[0]
+            if header == _INT_TYPE | HEADER_DATA_FLAG_64:
+                return _unpack_int64(view, idx + 4)[0]
+    except (ValueError, struct.error):
+        pass
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Incremental decoding of concatenated variants, fed chunk by chunk.
+
+
+def _container_prefix_size(header: int) -> int:
+    """Bytes between an array/dictionary header and its element count."""
+    if header & HEADER_TYPE_MASK == TypeCode.LIST_TYPE:
+        kinds = [
+            (header & HEADER_DATA_FIELD_TYPED_ARRAY_MASK)
+            >> HEADER_DATA_FIELD_TYPED_ARRAY_SHIFT
+        ]
+    else:
+        kinds = [
+            (header & HEADER_DATA_FIELD_TYPED_DICTIONARY_KEY_MASK)
+            >> HEADER_DATA_FIELD_TYPED_DICTIONARY_KEY_SHIFT,
+            (header & HEADER_DATA_FIELD_TYPED_DICTIONARY_VALUE_MASK)
+            >> HEADER_DATA_FIELD_TYPED_DICTIONARY_VALUE_SHIFT,
+        ]
+    size = 0
+    for kind in kinds:
+        if kind == ContainerTypeKind.BUILTIN:
+            size += 4
+        elif kind != ContainerTypeKind.NONE:
+            raise ValueError(
+                f"[GdType] Unable to deserialize: unsupported container type {ContainerTypeKind(kind)}"
+            )
+    return size
+
+
+def _scan(view: memoryview, idx: int, remaining: int) -> tuple[int, int]:
+    """
+    Skips over as many of the `remaining` values starting at `idx` as the
+    buffer holds. Returns where it stopped and how many values are left,
+    so the scan resumes there once more data has arrived.
+    """
+    end = len(view)
+    while remaining and idx + 4 <= end:
+        header = _unpack_uint32(view, idx)[0]
+        typecode = header & HEADER_TYPE_MASK
+        children = 0
+        if typecode == TypeCode.INT_TYPE or typecode == TypeCode.FLOAT_TYPE:
+            size = 12 if header & HEADER_DATA_FLAG_64 else 8
+        elif typecode == TypeCode.NULL_TYPE:
+            size = 4
+        elif typecode == TypeCode.BOOL_TYPE:
+            size = 8
+        elif typecode == TypeCode.VECTOR2I_TYPE:
+            size = 12
+        elif typecode in (
+            TypeCode.LIST_TYPE,
+            TypeCode.DICTIONARY_TYPE,
+        ):
+            size = 8 + _container_prefix_size(header)
+            if idx + size > end:
+                break
+            children = _unpack_uint32(view, idx + size - 4)[0] & 0x7FFFFFFF
+            if typecode == TypeCode.DICTIONARY_TYPE:
+                children *= 2
+        else:
+            if idx + 8 > end:
+                break
+            count = _unpack_uint32(view, idx + 4)[0]
+            if typecode == TypeCode.STRING_TYPE or (
+                typecode == TypeCode.PACKED_BYTE_ARRAY_TYPE
+            ):
+                size = 8 + count + (-count & 3)
+            elif typecode in _PACKED_ITEM_SIZES:
+                size = 8 + count * _PACKED_ITEM_SIZES[typecode]
+            elif typecode == TypeCode.PACKED_VECTOR2_ARRAY_TYPE:
+                size = 8 + count * (16 if header & HEADER_DATA_FLAG_64 else 8)
+            else:
                 raise ValueError(
-                    f"[GdType] Unable to deserialize: unsupported type code {typecode} at {idx - 4}"
+                    f"[GdType] Unable to deserialize: unsupported type code {typecode} at {idx}"
                 )
+        if idx + size > end:
+            break
+        idx += size
+        remaining += children - 1
+    return idx, remaining
+
+
+class StreamDecoder:
+    """
+    Decodes a stream of concatenated variants fed in chunks of any size,
+    e.g. a recorded traffic log or a socket buffer.
+
+    Each value is scanned only once across chunks, so a value split over many
+    chunks is not re-parsed from its start every time. Only the bytes of
+    values not yet completed are kept. With `length_prefixed`, every value is
+    preceded by its size as a little-endian uint32, as Godot's
+    `PacketPeerStream` writes them.
+
+    ```python
+    decoder = StreamDecoder()
+    for chunk in iter(lambda: f.read(65536), b""):
+        for value in decoder.feed(chunk):
+            ...
+    decoder.finish()
+    ```
+    """
+
+    def __init__(
+        self,
+        length_prefixed: bool = False,
+        lazy: bool = False,
+        max_value_size: int | None = None,
+    ) -> None:
+        self.length_prefixed = length_prefixed
+        self.lazy = lazy
+        self.max_value_size = max_value_size
+        self._buffer = bytearray()
+        # scan state of the value at the start of the buffer
+        self._scanned = 0
+        self._remaining = 1
+
+    @property
+    def pending(self) -> int:
+        """Bytes buffered for a value that is not complete yet."""
+        return len(self._buffer)
+
+    def feed(self, chunk: bytes | bytearray | memoryview) -> "StreamDecoder":
+        """Buffers `chunk`, then iterate over the decoder for the completed values."""
+        self._buffer += chunk
+        return self
+
+    def __iter__(self) -> Iterator[Any]:
+        while True:
+            end = self._complete_value_end()
+            if end is None:
+                return
+            start = 4 if self.length_prefixed else 0
+            with memoryview(self._buffer) as view:
+                serialized = bytes(view[start:end])
+            del self._buffer[:end]
+            self._scanned, self._remaining = 0, 1
+            yield bytes_to_var(serialized, lazy=self.lazy)
+
+    def _complete_value_end(self) -> int | None:
+        buffered = len(self._buffer)
+        if self.length_prefixed:
+            if buffered < 4:
+                return None
+            size = _unpack_uint32(self._buffer, 0)[0]
+            self._check_size(size)
+            return 4 + size if buffered >= 4 + size else None
+        with memoryview(self._buffer) as view:
+            self._scanned, self._remaining = _scan(view, self._scanned, self._remaining)
+        if self._remaining:
+            self._check_size(buffered)
+            return None
+        return self._scanned
+
+    def _check_size(self, size: int) -> None:
+        if self.max_value_size is not None and size > self.max_value_size:
+            raise ValueError(
+                f"[GdType] Unable to deserialize: value exceeds {self.max_value_size} bytes"
+            )
+
+    def finish(self) -> None:
+        """Raises if the stream ended in the middle of a value."""
+        if self._buffer:
+            raise _insufficient_data()
+
 
-    return _bytes_to_var()
+def decode_stream(
+    chunks: Iterable[bytes | bytearray | memoryview], **options: Any
+) -> Iterator[Any]:
+    """Decodes every value in a stream of chunks, see `StreamDecoder` for the options."""
+    decoder = StreamDecoder(**options)
+    for chunk in chunks:
+        yield from decoder.feed(chunk)
+    decoder.finish()
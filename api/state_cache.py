@@ -0,0 +1,142 @@
+import copy
+import math
+import time
+from enum import Enum
+from typing import Any, Hashable
+
+from .constants import CommandType, GameStatus
+from .frame_templates import _template_key
+
+# seconds a reply stays fresh; commands without an entry are never cached
+DEFAULT_TTLS: dict[CommandType, float] = {
+    # fixed for the whole game, dropped when the game status changes
+    CommandType.GET_ALL_TERRAIN: math.inf,
+    CommandType.GET_TERRAIN: math.inf,
+    CommandType.GET_SYSTEM_PATH: math.inf,
+    CommandType.GET_OPPONENT_PATH: math.inf,
+    CommandType.PIXELCAT: math.inf,
+    CommandType.GET_DEVS: math.inf,
+    # change every few game ticks
+    CommandType.GET_MONEY: 0.05,
+    CommandType.GET_INCOME: 0.05,
+    CommandType.GET_SCORES: 0.05,
+    CommandType.GET_CURRENT_WAVE: 0.05,
+    CommandType.GET_UNIT_COOLDOWN: 0.05,
+    CommandType.GET_SPELL_COOLDOWN: 0.05,
+    CommandType.GET_ALL_TOWERS: 0.1,
+    CommandType.GET_TOWER: 0.1,
+}
+
+# values returned as they are, everything else is copied in and out of the cache
+_IMMUTABLE = (type(None), bool, int, float, str, Enum)
+
+# the cached replies each write command makes stale
+INVALIDATED_BY: dict[CommandType, tuple[CommandType, ...]] = {
+    CommandType.PLACE_TOWER: (
+        CommandType.GET_ALL_TOWERS,
+        CommandType.GET_TOWER,
+        CommandType.GET_MONEY,
+    ),
+    CommandType.SELL_TOWER: (
+        CommandType.GET_ALL_TOWERS,
+        CommandType.GET_TOWER,
+        CommandType.GET_MONEY,
+    ),
+    CommandType.SET_STRATEGY: (CommandType.GET_ALL_TOWERS, CommandType.GET_TOWER),
+    CommandType.SPAWN_UNIT: (
+        CommandType.GET_MONEY,
+        CommandType.GET_INCOME,
+        CommandType.GET_UNIT_COOLDOWN,
+    ),
+    CommandType.CAST_SPELL: (CommandType.GET_SPELL_COOLDOWN,),
+    CommandType.SEND_CHAT: (CommandType.GET_CHAT_HISTORY,),
+}
+
+
+class StateCache:
+    """
+    Read-through cache of command replies, with a time to live per command.
+
+    `ttls` overrides entries of `DEFAULT_TTLS`; a TTL of 0 disables caching
+    for that command. Each write command drops the replies listed for it in
+    `INVALIDATED_BY`, and a change of the game status drops everything.
+    The cache keeps its own copy of a value and every hit returns a new
+    copy, so callers may modify what they get.
+    """
+
+    def __init__(self, ttls: dict[CommandType, float] | None = None) -> None:
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        # (command, args key) -> (expiry on the monotonic clock, value)
+        self._entries: dict[Hashable, tuple[float, Any]] = {}
+        self._game_status: Any = None
+        # bumped by every invalidation, so a read that was in flight across
+        # a write does not store what it got from before the write
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def key(
+        self, command_id: CommandType, args: list[Any], ret_type: Any
+    ) -> Hashable | None:
+        """The key of a cacheable command, None for the others."""
+        if self.ttls.get(command_id, 0) <= 0:
+            return None
+        key = _template_key(command_id, args)
+        # get_all_terrain and get_terrain_grid share a command, not a value
+        return key + (ret_type,) if key is not None else None
+
+    def lookup(self, key: Hashable) -> tuple[bool, Any]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self.hits += 1
+                value = entry[1]
+                if isinstance(value, _IMMUTABLE):
+                    return True, value
+                return True, copy.deepcopy(value)
+            del self._entries[key]
+        self.misses += 1
+        return False, None
+
+    def store(
+        self, command_id: CommandType, key: Hashable, generation: int, value: Any
+    ) -> None:
+        if generation == self.generation:
+            if not isinstance(value, _IMMUTABLE):
+                value = copy.deepcopy(value)
+            self._entries[key] = (time.monotonic() + self.ttls[command_id], value)
+
+    def observe(self, command_id: CommandType, value: Any) -> None:
+        """Invalidates the entries made stale by the reply of `command_id`."""
+        if command_id in INVALIDATED_BY:
+            self.invalidate(*INVALIDATED_BY[command_id])
+        elif isinstance(value, GameStatus):
+            # a new game may bring a new map
+            if self._game_status is not None and value != self._game_status:
+                self.clear()
+            self._game_status = value
+
+    def invalidate(self, *command_ids: CommandType) -> None:
+        self.generation += 1
+        self.invalidations += 1
+        # keys start with the command id, see _template_key
+        stale = {int(command_id) for command_id in command_ids}
+        for key in [key for key in self._entries if key[0] in stale]:  # type: ignore[index]
+            del self._entries[key]
+
+    def clear(self) -> None:
+        self.generation += 1
+        self.invalidations += 1
+        self._entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
@@ -1,6 +1,9 @@
 from __future__ import annotations
 
-from .constants import CommandType, StatusCode, TowerType, EnemyType
+from array import array
+from typing import Iterable, Iterator
+
+from .constants import CommandType, StatusCode, TowerType, EnemyType, TerrainType
 
 
 class Vector2:
@@ -17,6 +20,109 @@ class Vector2:
         return f"({self.x}, {self.y})"
 
 
+class PackedVector2Array:
+    """
+    一串浮點數二維向量，對應 Godot 的 `PackedVector2Array`。
+    座標以 `x0, y0, x1, y1, ...` 平鋪存放在 `coords`，不會為每個向量建立物件。
+    """
+
+    def __init__(self, coords: array | None = None) -> None:
+        self.coords = coords if coords is not None else array("f")
+        """平鋪的座標，型別碼為 `"f"` 或 `"d"`。"""
+
+    @classmethod
+    def from_points(cls, points: Iterable[tuple[float, float]]) -> PackedVector2Array:
+        return cls(array("f", [c for point in points for c in point]))
+
+    def __len__(self) -> int:
+        return len(self.coords) // 2
+
+    def __getitem__(self, i: int) -> tuple[float, float]:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("PackedVector2Array index out of range")
+        return (self.coords[2 * i], self.coords[2 * i + 1])
+
+    def __iter__(self) -> Iterator[tuple[float, float]]:
+        coords = iter(self.coords)
+        return zip(coords, coords)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, PackedVector2Array) and self.coords == other.coords
+
+    def __str__(self) -> str:
+        return f"PackedVector2Array({list(self)})"
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+class TerrainGrid:
+    """
+    整張地圖的地形，以 row-major 的 `bytearray` 緊湊儲存，每格一個 byte。
+    `grid[x, y]` 等同於 `get_all_terrain()[x][y]`。
+    """
+
+    _TERRAIN_TYPES = {terrain.value: terrain for terrain in TerrainType}
+
+    def __init__(self, rows: int, cols: int, cells: bytearray) -> None:
+        if len(cells) != rows * cols:
+            raise ValueError(f"expected {rows * cols} cells, got {len(cells)}")
+
+        self.rows = rows
+        """第一個索引 (x) 的範圍大小。"""
+
+        self.cols = cols
+        """第二個索引 (y) 的範圍大小。"""
+
+        self.cells = cells
+        """所有格子的 `TerrainType` 數值，`(x, y)` 位於 `x * cols + y`。"""
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        """`(rows, cols)`。"""
+        return (self.rows, self.cols)
+
+    def __getitem__(self, pos: "tuple[int, int] | Vector2") -> TerrainType:
+        """取得 `(x, y)` 的地形，超出地圖範圍時回傳 `TerrainType.OUT_OF_BOUNDS`。"""
+        x, y = (pos.x, pos.y) if isinstance(pos, Vector2) else pos
+        if 0 <= x < self.rows and 0 <= y < self.cols:
+            return self._TERRAIN_TYPES[self.cells[x * self.cols + y]]
+        return TerrainType.OUT_OF_BOUNDS
+
+    def row(self, x: int) -> memoryview:
+        """第 x 列所有格子的數值，不複製資料。"""
+        if not 0 <= x < self.rows:
+            raise IndexError(f"row {x} out of range")
+        return memoryview(self.cells)[x * self.cols : (x + 1) * self.cols]
+
+    def to_lists(self) -> list[list[TerrainType]]:
+        """轉換成與 `get_all_terrain()` 相同格式的二維陣列。"""
+        types = self._TERRAIN_TYPES
+        cells = self.cells
+        cols = self.cols
+        return [
+            [types[value] for value in cells[x * cols : (x + 1) * cols]]
+            for x in range(self.rows)
+        ]
+
+    def to_numpy(self):
+        """
+        以形狀為 `(rows, cols)`、型別為 `uint8` 的 NumPy 陣列檢視地形，與本物件共用記憶體。
+        需要另外安裝 NumPy。
+        """
+        import numpy
+
+        return numpy.frombuffer(self.cells, dtype=numpy.uint8).reshape(self.shape)
+
+    def __str__(self) -> str:
+        return f"TerrainGrid(rows={self.rows}, cols={self.cols})"
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
 class ApiException(Exception):
     """代表一次失敗的 API 呼叫後回傳的錯誤，附帶關於錯誤來源、錯誤種類、說明文字的資訊。"""
 
@@ -34,6 +140,13 @@ class ApiException(Exception):
         """完整錯誤訊息內容。"""
 
 
+class UncertainWriteError(ApiException):
+    """
+    連線在指令送出之後、收到回覆之前中斷，無法確定指令是否已經生效。
+    只會發生在會改變遊戲狀態的指令，這類指令不會被自動重送，請自行查詢狀態後再決定是否重試。
+    """
+
+
 class Tower:
     """關於一座防禦塔的屬性、數值資訊。"""
 
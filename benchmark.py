@@ -0,0 +1,639 @@
+"""
+Offline benchmark and round-trip suite for the Godot variant codec in
+`api.serialization`.
+
+Payloads mimic the replies captured from the game server: terrain grids,
+enemy and tower lists and chat history, each wrapped as
+`[request_id, status, value]`. Every case reports microseconds and
+operations per second, and bytes allocated per call. The command wrapper
+and reply caster cases time the work of a call before its command reaches
+the network and after its reply is decoded.
+
+Before timing anything, randomized round-trips through `var_to_bytes` and
+`bytes_to_var` are checked (negative and 64-bit ints, float32/float64
+edges, nested arrays and dictionaries, packed arrays, typed containers).
+
+    python benchmark.py                      # check, then benchmark
+    python benchmark.py --check              # round-trips only
+    python benchmark.py --save base.json     # record timings
+    python benchmark.py --compare base.json  # fail on regressions
+
+The exit status is non-zero when a round-trip fails or, with `--compare`,
+when a case got slower than the recorded timing by more than `--tolerance`.
+"""
+
+import argparse
+import json
+import math
+import random
+import struct
+import sys
+import timeit
+import tracemalloc
+from array import array
+from typing import Any, Callable
+
+from api.casters import reply_caster
+from api.constants import ChatSource, CommandType, SpellType, StatusCode, TerrainType
+from api.frame_templates import FrameTemplateCache
+from api.serialization import (
+    HEADER_DATA_FIELD_TYPED_ARRAY_SHIFT,
+    HEADER_DATA_FIELD_TYPED_DICTIONARY_KEY_SHIFT,
+    HEADER_DATA_FIELD_TYPED_DICTIONARY_VALUE_SHIFT,
+    ContainerTypeKind,
+    LazyList,
+    TypeCode,
+    bytes_to_var,
+    schema_reply_decoder,
+    var_to_bytes,
+)
+from api.game_client import GameClient
+from api.game_client_base import GameCommand
+from api.structures import (
+    ApiException,
+    Enemy,
+    PackedVector2Array,
+    TerrainGrid,
+    Tower,
+    Vector2,
+)
+
+# ---------------------------------------------------------------------------
+# payloads
+
+
+def reply(value: Any) -> bytes:
+    return var_to_bytes([1, 200, value])
+
+
+def terrain_payload(size: int) -> bytes:
+    return reply([[(x * 7 + y * 3) % 4 for y in range(size)] for x in range(size)])
+
+
+def enemies_payload(count: int) -> bytes:
+    return reply(
+        [
+            {
+                "type": i % 7,
+                "position": {"x": i % 20, "y": i % 13},
+                "progress_ratio": 0.25,
+                "income_impact": -5 if i % 2 else 5,
+                "health": 100 + i,
+                "max_health": 300,
+                "damage": 10,
+                "max_speed": 3,
+                "flying": i % 3 == 0,
+                "knockback_resist": False,
+                "kill_reward": 15,
+            }
+            for i in range(count)
+        ]
+    )
+
+
+def towers_payload(count: int) -> bytes:
+    return reply(
+        [
+            {
+                "type": i % 5 + 1,
+                "position": {"x": i % 20, "y": i // 20},
+                "level_a": 1 + i % 3,
+                "level_b": 1,
+                "aim": True,
+                "anti_air": i % 2 == 0,
+                "reload": 60,
+                "range": 3,
+                "damage": 25,
+                "bullet_effect": "none",
+            }
+            for i in range(count)
+        ]
+    )
+
+
+def chat_payload(count: int) -> bytes:
+    return reply([[i % 3, f"message number {i} :)"] for i in range(count)])
+
+
+# ---------------------------------------------------------------------------
+# reference: the byte-by-byte decoder this codec replaced
+
+
+def legacy_bytes_to_var(serialized: bytes) -> Any:
+    idx = 0
+
+    def pop_int32() -> int:
+        nonlocal idx
+        result = 0
+        for i in range(4):
+            result = result * 256 + serialized[idx + 3 - i]
+        idx += 4
+        return result
+
+    def pop_string() -> str:
+        nonlocal idx
+        length = pop_int32()
+        value = serialized[idx : idx + length].decode("utf-8")
+        idx += length + (-length & 3)
+        return value
+
+    def pop() -> Any:
+        nonlocal idx
+        header = pop_int32()
+        typecode = header & 0xFF
+        if typecode == 0:
+            return None
+        if typecode == 1:
+            return pop_int32() == 1
+        if typecode == 2:
+            lo = pop_int32()
+            return lo if lo < 2**31 else lo - 2**31
+        if typecode == 3:
+            return struct.unpack(">f", struct.pack(">I", pop_int32()))[0]
+        if typecode == 4:
+            return pop_string()
+        if typecode == 27:
+            count = pop_int32() & 0x7FFFFFFF
+            return {pop(): pop() for _ in range(count)}
+        if typecode == 28:
+            length = pop_int32() & 0x7FFFFFFF
+            return [pop() for _ in range(length)]
+        raise ValueError(typecode)
+
+    return pop()
+
+
+# ---------------------------------------------------------------------------
+# round-trips
+
+EDGE_INTS = [0, 1, -1, 2**31 - 1, -(2**31), 2**31, -(2**31) - 1, 2**63 - 1, -(2**63)]
+EDGE_FLOATS = [
+    0.0,
+    -0.0,
+    0.5,
+    0.1,  # not exact in float32
+    1.401298464324817e-45,  # smallest float32 subnormal
+    3.4028234663852886e38,  # largest float32
+    3.4028235677973366e38,  # rounds to float32 infinity
+    1e-300,
+    1e300,
+    math.inf,
+    -math.inf,
+    math.nan,
+]
+EDGE_STRINGS = ["", "a", "ab", "abc", "abcd", "héllo", "飛行敵人", "\x00", "x" * 300]
+
+
+def random_variant(rng: random.Random, depth: int = 0) -> Any:
+    kind = rng.randrange(12 if depth < 3 else 8)
+    if kind == 0:
+        return None
+    if kind == 1:
+        return rng.random() < 0.5
+    if kind == 2:
+        return rng.choice(EDGE_INTS + [rng.randrange(-(2**63), 2**63)])
+    if kind == 3:
+        return rng.choice(
+            EDGE_FLOATS + [struct.unpack("<f", struct.pack("<f", rng.random()))[0]]
+        )
+    if kind == 4:
+        return rng.choice(EDGE_STRINGS)
+    if kind == 5:
+        return Vector2(rng.randrange(-(2**31), 2**31), rng.randrange(-100, 100))
+    if kind == 6:
+        return bytes(rng.randrange(256) for _ in range(rng.randrange(9)))
+    if kind == 7:
+        typecode = rng.choice("iqfd")
+        values = [rng.randrange(-(2**31), 2**31) for _ in range(rng.randrange(6))]
+        if typecode in "fd":
+            values = [v / 4 for v in values]
+        return array(typecode, values)
+    if kind == 8:
+        return PackedVector2Array(
+            array(rng.choice("fd"), [rng.randrange(100) / 2 for _ in range(4)])
+        )
+    if kind in (9, 10):
+        return [random_variant(rng, depth + 1) for _ in range(rng.randrange(6))]
+    return {
+        rng.choice(EDGE_STRINGS[:6] + EDGE_INTS[:4]): random_variant(rng, depth + 1)
+        for _ in range(rng.randrange(5))
+    }
+
+
+def normalize(value: Any) -> Any:
+    """Something comparable with ==, also for nan and Vector2."""
+    if isinstance(value, float):
+        return ("nan",) if math.isnan(value) else (value, math.copysign(1, value))
+    if isinstance(value, Vector2):
+        return ("Vector2", value.x, value.y)
+    if isinstance(value, PackedVector2Array):
+        return ("PackedVector2Array", value.coords.typecode, list(value.coords))
+    if isinstance(value, array):
+        return ("array", value.typecode, [normalize(v) for v in value])
+    if isinstance(value, bytearray):
+        return bytes(value)
+    if isinstance(value, (list, LazyList)):
+        return [normalize(v) for v in value]
+    if isinstance(value, dict):
+        return [(normalize(k), normalize(v)) for k, v in value.items()]
+    return (type(value), value)
+
+
+def typed_containers() -> list[tuple[str, bytes, Any]]:
+    """Frames with typed array/dictionary headers, which var_to_bytes never writes."""
+    builtin = ContainerTypeKind.BUILTIN
+    typed_list = TypeCode.LIST_TYPE | builtin << HEADER_DATA_FIELD_TYPED_ARRAY_SHIFT
+    typed_dict = (
+        TypeCode.DICTIONARY_TYPE
+        | builtin << HEADER_DATA_FIELD_TYPED_DICTIONARY_KEY_SHIFT
+        | builtin << HEADER_DATA_FIELD_TYPED_DICTIONARY_VALUE_SHIFT
+    )
+    return [
+        (
+            "Array[int]",
+            struct.pack("<3I", typed_list, TypeCode.INT_TYPE, 2)
+            + var_to_bytes(-3)
+            + var_to_bytes(4),
+            [-3, 4],
+        ),
+        (
+            "Dictionary[String, int]",
+            struct.pack("<4I", typed_dict, TypeCode.STRING_TYPE, TypeCode.INT_TYPE, 1)
+            + var_to_bytes("a")
+            + var_to_bytes(2**40),
+            {"a": 2**40},
+        ),
+        (
+            "Array[Array] in a reply",
+            struct.pack("<2I", TypeCode.LIST_TYPE, 3)
+            + var_to_bytes(7)
+            + var_to_bytes(200)
+            + struct.pack("<3I", typed_list, TypeCode.LIST_TYPE, 1)
+            + var_to_bytes([1]),
+            [7, 200, [[1]]],
+        ),
+    ]
+
+
+def check_round_trips(count: int, seed: int) -> list[str]:
+    failures = []
+    rng = random.Random(seed)
+    values = EDGE_INTS + EDGE_FLOATS + EDGE_STRINGS + [{}, [], [[]], {"": {}}]
+    values += [random_variant(rng) for _ in range(count)]
+    for value in values:
+        try:
+            encoded = var_to_bytes(value)
+            for lazy in (False, True):
+                decoded = bytes_to_var(encoded, lazy=lazy)
+                if normalize(decoded) != normalize(value):
+                    failures.append(f"{value!r} (lazy={lazy}) decoded as {decoded!r}")
+        except Exception as e:
+            failures.append(f"{value!r} raised {e!r}")
+    for name, encoded, expected in typed_containers():
+        decoded = bytes_to_var(encoded)
+        if normalize(decoded) != normalize(expected):
+            failures.append(f"{name} decoded as {decoded!r}")
+    return failures
+
+
+# ---------------------------------------------------------------------------
+# reference: the per-call work of the command wrappers before they were generated
+
+
+class NullClient:
+    """Takes the place of a client, returns the arguments a command would send."""
+
+    def __init__(self, trusted: bool = False) -> None:
+        self.trusted = trusted
+
+    def await_send_command(
+        self,
+        command_id: CommandType,
+        args: list[Any],
+        arg_types: list[type],
+        inner_ret_type: type | None,
+        **options: Any,
+    ) -> list[Any]:
+        return args
+
+
+def legacy_command_call(
+    command: GameCommand, client: NullClient, *args: Any
+) -> list[Any] | ApiException:
+    # defaults looked up in the signature, then every argument type checked
+    full_args = list(args)
+    parameters = list(command.signature.parameters.values())[1:]
+    for i in range(len(full_args), len(parameters)):
+        full_args.append(parameters[i].default)
+    if len(command.arg_types) != len(full_args):
+        return ApiException(
+            command.command_id, StatusCode.ILLFORMED_COMMAND, "argument count"
+        )
+    for i in range(len(command.arg_types)):
+        if not isinstance(full_args[i], command.arg_types[i]):
+            return ApiException(
+                command.command_id, StatusCode.ILLEGAL_ARGUMENT, "type mismatch"
+            )
+    return client.await_send_command(
+        command.command_id, full_args, command.arg_types, command.inner_ret_type
+    )
+
+
+def legacy_cast(ret_type: Any, value: Any) -> Any:
+    # the annotation walked again for every element of every reply
+    if isinstance(value, list):
+        if ret_type.__origin__ is list:
+            return [legacy_cast(ret_type.__args__[0], item) for item in value]
+        return tuple(
+            legacy_cast(item_type, item)
+            for item_type, item in zip(ret_type.__args__, value)
+        )
+    if isinstance(value, ret_type):
+        return value
+    return ret_type(value)
+
+
+def legacy_cast_reply(ret_type: Any, ret: list) -> Any:
+    if not isinstance(ret, list) or len(ret) < 2 or not isinstance(ret[0], int):
+        raise ValueError("malformed reply")
+    if ret[1] not in StatusCode or StatusCode(ret[1]) != StatusCode.OK:
+        raise ValueError("status")
+    return legacy_cast(ret_type, ret[2])
+
+
+# ---------------------------------------------------------------------------
+# harness
+
+
+class Case:
+    def __init__(
+        self,
+        group: str,
+        name: str,
+        fn: Callable,
+        *args: Any,
+        before: Callable | None = None,
+        before_args: tuple | None = None,
+    ) -> None:
+        self.group = group
+        self.name = name
+        self.fn = fn
+        self.args = args
+        # the implementation this case is compared against, if any
+        self.before = before
+        self.before_args = before_args if before_args is not None else args
+
+    @property
+    def key(self) -> str:
+        return f"{self.group} / {self.name}"
+
+
+def measure(fn: Callable, *args: Any, repeat: int = 5) -> float:
+    """Returns the best time of one call in microseconds."""
+    timer = timeit.Timer(lambda: fn(*args))
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e6
+
+
+def allocated(fn: Callable, *args: Any) -> int:
+    """Returns the peak bytes allocated by one call."""
+    fn(*args)  # warm up caches first
+    tracemalloc.start()
+    try:
+        fn(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def build_cases() -> list[Case]:
+    cases = []
+    for n in (16, 32, 64):
+        payload = terrain_payload(n)
+        cases.append(
+            Case(
+                "bytes_to_var",
+                f"terrain {n}x{n}",
+                bytes_to_var,
+                payload,
+                before=legacy_bytes_to_var,
+            )
+        )
+    for n in (10, 100, 1000):
+        payload = enemies_payload(n)
+        cases.append(
+            Case(
+                "bytes_to_var",
+                f"enemies x{n}",
+                bytes_to_var,
+                payload,
+                before=legacy_bytes_to_var,
+            )
+        )
+    cases.append(Case("bytes_to_var", "towers x50", bytes_to_var, towers_payload(50)))
+    cases.append(Case("bytes_to_var", "chat x15", bytes_to_var, chat_payload(15)))
+
+    def enemies_from_dicts(payload: bytes) -> list[Enemy]:
+        return [Enemy.from_dict(enemy) for enemy in bytes_to_var(payload)[2]]
+
+    def towers_from_dicts(payload: bytes) -> list[Tower | None]:
+        return [Tower.from_dict(tower) for tower in bytes_to_var(payload)[2]]
+
+    for n in (10, 100, 1000):
+        cases.append(
+            Case(
+                "schema list[Enemy]",
+                f"enemies x{n}",
+                schema_reply_decoder(list[Enemy]),
+                enemies_payload(n),
+                before=enemies_from_dicts,
+            )
+        )
+    cases.append(
+        Case(
+            "schema list[Tower]",
+            "towers x50",
+            schema_reply_decoder(list[Tower]),
+            towers_payload(50),
+            before=towers_from_dicts,
+        )
+    )
+
+    eager = schema_reply_decoder(list[Enemy])
+    lazy = schema_reply_decoder(list[Enemy], lazy=True)
+
+    def first_five(decode_reply, payload: bytes) -> list[Enemy]:
+        enemies = decode_reply(payload)[0][2]
+        return [enemies[i] for i in range(min(5, len(enemies)))]
+
+    for n in (100, 1000):
+        payload = enemies_payload(n)
+        cases.append(
+            Case(
+                "lazy list[Enemy], first 5",
+                f"enemies x{n}",
+                lambda payload: first_five(lazy, payload),
+                payload,
+                before=lambda payload: first_five(eager, payload),
+            )
+        )
+
+    def nested_terrain(payload: bytes) -> list[list[TerrainType]]:
+        return [list(map(TerrainType, row)) for row in bytes_to_var(payload)[2]]
+
+    for n in (16, 64, 128):
+        cases.append(
+            Case(
+                "schema TerrainGrid",
+                f"terrain {n}x{n}",
+                schema_reply_decoder(TerrainGrid),
+                terrain_payload(n),
+                before=nested_terrain,
+            )
+        )
+
+    for n in (256, 4096):
+        cases.append(
+            Case(
+                "packed arrays",
+                f"int32 x{n}",
+                bytes_to_var,
+                var_to_bytes(array("i", range(n))),
+                before=bytes_to_var,
+                before_args=(var_to_bytes(list(range(n))),),
+            )
+        )
+
+    frames = [
+        ("get_money(True)", [12, CommandType.GET_MONEY, True]),
+        ("place_tower(...)", [12, CommandType.PLACE_TOWER, 1, "2a", Vector2(3, 4)]),
+        ("send_chat(...)", [12, CommandType.SEND_CHAT, "你說飛行敵人太強。"]),
+    ]
+    templates = FrameTemplateCache()
+    for name, frame in frames:
+        cases.append(Case("var_to_bytes", name, var_to_bytes, frame))
+    for name, (request_id, command_id, *args) in frames:
+        cases.append(
+            Case(
+                "FrameTemplateCache.encode",
+                name,
+                templates.encode,
+                request_id,
+                command_id,
+                args,
+                before=lambda *frame: var_to_bytes(
+                    [frame[0], int(frame[1]), *frame[2]]
+                ),
+            )
+        )
+
+    replies = [
+        (
+            "terrain 32x32",
+            list[list[TerrainType]],
+            bytes_to_var(terrain_payload(32)),
+        ),
+        ("chat x15", list[tuple[ChatSource, str]], bytes_to_var(chat_payload(15))),
+        ("money", int, [1, 200, 1000]),
+    ]
+    for name, ret_type, ret in replies:
+        cases.append(
+            Case(
+                "reply caster",
+                name,
+                reply_caster(CommandType.GET_ALL_TERRAIN, ret_type),
+                ret,
+                False,
+                before=legacy_cast_reply,
+                before_args=(ret_type, ret),
+            )
+        )
+
+    calls = [
+        ("get_money(True)", GameClient.get_money, (True,)),
+        ("get_tower(...)", GameClient.get_tower, (True, Vector2(3, 4))),
+        ("cast_spell(POISON)", GameClient.cast_spell, (SpellType.POISON,)),
+    ]
+    for trusted in (False, True):
+        client = NullClient(trusted)
+        for name, method, args in calls:
+            cases.append(
+                Case(
+                    "command wrapper" + (", trusted" if trusted else ""),
+                    name,
+                    method,
+                    client,
+                    *args,
+                    before=legacy_command_call,
+                    before_args=(method.game_command, client, *args),
+                )
+            )
+    return cases
+
+
+def run(cases: list[Case], repeat: int) -> dict[str, float]:
+    results = {}
+    group = None
+    for case in cases:
+        if case.group != group:
+            group = case.group
+            print(f"== {group}")
+        us = measure(case.fn, *case.args, repeat=repeat)
+        line = (
+            f"{case.name:<20} {us:>10.1f} us {1e6 / us:>11,.0f} op/s"
+            f" {allocated(case.fn, *case.args):>10,} B"
+        )
+        if case.before is not None:
+            before_us = measure(case.before, *case.before_args, repeat=repeat)
+            line += f"   before {before_us:>10.1f} us  x{before_us / us:.1f}"
+        print(line)
+        results[case.key] = us
+    return results
+
+
+def compare(
+    results: dict[str, float], baseline: dict[str, float], tolerance: float
+) -> list[str]:
+    regressions = []
+    for key, us in results.items():
+        if key in baseline and us > baseline[key] * (1 + tolerance):
+            regressions.append(f"{key}: {baseline[key]:.1f} us -> {us:.1f} us")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--check", action="store_true", help="only run the round-trips")
+    parser.add_argument("--seed", type=int, default=2025)
+    parser.add_argument("--round-trips", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5, help="timing repetitions")
+    parser.add_argument("--save", metavar="FILE", help="write timings as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="compare with saved timings")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    options = parser.parse_args()
+
+    failures = check_round_trips(options.round_trips, options.seed)
+    for failure in failures:
+        print(f"round-trip FAILED: {failure}")
+    print(f"round-trips: {len(failures)} failure(s), seed {options.seed}")
+    if failures:
+        return 1
+    if options.check:
+        return 0
+
+    results = run(build_cases(), options.repeat)
+    if options.save:
+        with open(options.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if options.compare:
+        with open(options.compare) as f:
+            regressions = compare(results, json.load(f), options.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())